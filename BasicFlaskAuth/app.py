@@ -1,8 +1,9 @@
 from flask import Flask, request, abort
-import json
+import os
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+from fsnd_common.jwks import JWKSCache
+from fsnd_common.token_cache import TokenCache
 
 
 app = Flask(__name__)
@@ -11,6 +12,11 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+# JWKS_URL points the verifier at a local file or a stand-in server in tests.
+# The first verification starts the background refresh, importing fetches nothing
+jwks = JWKSCache(os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'), background=True)
+verified_tokens = TokenCache()
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -52,25 +58,14 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -110,7 +105,7 @@ def requires_auth(f):
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
         try:
-            payload = verify_decode_jwt(token)
+            payload = verified_tokens.verify(token, verify_decode_jwt)
         except:
             abort(401)
         return f(payload, *args, **kwargs)
@@ -1,8 +1,12 @@
-from flask import Flask, request, jsonify, abort
+import os
+from flask import Flask, request, jsonify, abort, json
+
+from store import MemoryStore, SQLiteStore
+from fsnd_common.conditional import conditional
 
 app = Flask(__name__)
 
-greetings = {
+initial_greetings = {
             'en': 'hello', 
             'es': 'Hola', 
             'ar': 'مرحبا',
@@ -12,22 +16,33 @@ greetings = {
             'ja': 'こんにちは'
             }
 
+# GREETINGS_DB shares the greetings between worker processes
+if os.environ.get('GREETINGS_DB'):
+    greetings = SQLiteStore(os.environ['GREETINGS_DB'], initial_greetings)
+else:
+    greetings = MemoryStore(initial_greetings)
+
+def greetings_response():
+    body = greetings.serialized(lambda items: json.dumps({'greetings': items}))
+    return app.response_class(body + '\n', mimetype='application/json')
+
 @app.route('/greeting', methods=['GET'])
+@conditional(lambda: greetings.etag())
 def greeting_all():
-    return jsonify({'greetings': greetings})
+    return greetings_response()
 
 @app.route('/greeting/<lang>', methods=['GET'])
 def greeting_one(lang):
     print(lang)
-    if(lang not in greetings):
+    greeting = greetings.get(lang)
+    if(greeting is None):
         abort(404)
-    return jsonify({'greeting': greetings[lang
-    ]})
+    return jsonify({'greeting': greeting})
 
 @app.route('/greeting', methods=['POST'])
 def greeting_add():
     info = request.get_json()
     if('lang' not in info or 'greeting' not in info):
         abort(422)
-    greetings[info['lang']] = info['greeting']
-    return jsonify({'greetings':greetings})
+    greetings.set(info['lang'], info['greeting'])
+    return greetings_response()
@@ -0,0 +1,105 @@
+'''
+Concurrency benchmark for the greetings stores.
+
+    python bench.py
+
+Threads, then worker processes, hit GET and POST /greeting through the test
+client. Every POST adds a new language, so the number of greetings at the
+end shows whether any write was lost or not seen by the process reading.
+'''
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import FlaskRecap
+from store import MemoryStore, SQLiteStore
+
+THREADS = 8
+REQUESTS = 2000
+# one request in WRITE_EVERY adds a greeting
+WRITE_EVERY = 10
+
+
+def client_requests(worker, requests):
+    client = FlaskRecap.app.test_client()
+    for i in range(requests):
+        if i % WRITE_EVERY == 0:
+            client.post('/greeting', json={'lang': 'w{}-{}'.format(worker, i), 'greeting': 'hi'})
+        else:
+            client.get('/greeting')
+
+
+def writes(workers, requests):
+    return workers * len(range(0, requests, WRITE_EVERY))
+
+
+def report(name, seconds, requests, expected, found):
+    print('{:<32} {:>8.0f} req/s   greetings {:>5} of {:>5}{}'.format(
+        name, requests / seconds, found, expected, '' if found == expected else '  LOST WRITES'))
+
+
+def bench_threads(name, store):
+    FlaskRecap.greetings = store
+    expected = len(FlaskRecap.initial_greetings) + writes(THREADS, REQUESTS)
+    threads = [threading.Thread(target=client_requests, args=(worker, REQUESTS)) for worker in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    report('{}, {} threads'.format(name, THREADS), seconds, THREADS * REQUESTS, expected, len(store.snapshot()[1]))
+
+
+def process_worker(path, worker):
+    FlaskRecap.greetings = SQLiteStore(path, FlaskRecap.initial_greetings) if path else MemoryStore(FlaskRecap.initial_greetings)
+    client_requests(worker, REQUESTS)
+
+
+def bench_processes(name, path, processes=4):
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=process_worker, args=(path, worker)) for worker in range(processes)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - start
+    # what a further worker process would serve
+    store = SQLiteStore(path) if path else MemoryStore(FlaskRecap.initial_greetings)
+    expected = len(FlaskRecap.initial_greetings) + writes(processes, REQUESTS)
+    report('{}, {} processes'.format(name, processes), seconds, processes * REQUESTS, expected, len(store.snapshot()[1]))
+
+
+def bench_body(size=10000, requests=500):
+    # GETs of a large map: the cached body against serializing every time
+    store = MemoryStore({'lang{}'.format(i): 'hello' for i in range(size)})
+    FlaskRecap.greetings = store
+    client = FlaskRecap.app.test_client()
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get('/greeting')
+    cached = time.perf_counter() - start
+    start = time.perf_counter()
+    with FlaskRecap.app.app_context():
+        for _ in range(requests):
+            FlaskRecap.jsonify({'greetings': store.snapshot()[1]})
+    print('GET {} greetings x{}: serialize each {:.1f} ms, cached body {:.1f} ms'.format(
+        size, requests, (time.perf_counter() - start) * 1000, cached * 1000))
+
+
+def main():
+    bench_body()
+    with tempfile.TemporaryDirectory() as directory:
+        bench_threads('memory', MemoryStore(FlaskRecap.initial_greetings))
+        bench_threads('sqlite', SQLiteStore(os.path.join(directory, 'threads.db'), FlaskRecap.initial_greetings))
+        if sys.platform != 'win32':
+            bench_processes('memory', None)
+            bench_processes('sqlite', os.path.join(directory, 'processes.db'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+'''
+Key-value stores behind the greetings routes.
+
+    MemoryStore   a dict behind a lock, for a single process
+    SQLiteStore   an SQLite file every worker process opens, so a greeting
+                  added through one worker is served by all of them
+
+Both count writes in a version number, etag() tags it with an epoch that
+changes whenever the count could start over (a new process for MemoryStore,
+a new database file for SQLiteStore). serialized() keeps the response body
+built from the store and rebuilds it only when the version moved, so a GET
+does not serialize the whole map again, and with SQLiteStore a write made by
+another process is picked up by the next GET.
+'''
+import os
+import sqlite3
+import threading
+
+
+class Store(object):
+    def __init__(self):
+        self.body = None
+        self.body_lock = threading.Lock()
+
+    def etag(self):
+        return '{}-{}'.format(self.epoch, self.version())
+
+    def serialized(self, serialize):
+        '''
+        serialize(items) for the current contents, cached until the next write.
+        '''
+        body = self.body
+        version = self.version()
+        if body is not None and body[0] == version:
+            return body[1]
+        with self.body_lock:
+            version, items = self.snapshot()
+            if self.body is None or self.body[0] != version:
+                self.body = (version, serialize(items))
+            return self.body[1]
+
+
+class MemoryStore(Store):
+    def __init__(self, initial=None):
+        super(MemoryStore, self).__init__()
+        self.items = dict(initial or {})
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.epoch = os.urandom(4).hex()
+
+    def get(self, key):
+        with self.lock:
+            return self.items.get(key)
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.writes += 1
+
+    def version(self):
+        return self.writes
+
+    def snapshot(self):
+        with self.lock:
+            return self.writes, dict(self.items)
+
+
+class SQLiteStore(Store):
+    '''
+    Each thread gets its own connection. Writes bump the version in the same
+    transaction, WAL mode lets readers go on while a write is in progress.
+    '''
+    def __init__(self, path, initial=None, timeout=30):
+        super(SQLiteStore, self).__init__()
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+        with self.transaction() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS version ('
+                'id INTEGER PRIMARY KEY CHECK (id = 1), writes INTEGER NOT NULL, epoch TEXT NOT NULL)')
+            connection.execute('INSERT OR IGNORE INTO version VALUES (1, 0, ?)', (os.urandom(4).hex(),))
+            connection.executemany('INSERT OR IGNORE INTO items VALUES (?, ?)', (initial or {}).items())
+            self.epoch = connection.execute('SELECT epoch FROM version').fetchone()[0]
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    def transaction(self, mode='IMMEDIATE'):
+        return Transaction(self.connection(), mode)
+
+    def get(self, key):
+        row = self.connection().execute('SELECT value FROM items WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        with self.transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO items VALUES (?, ?)', (key, value))
+            connection.execute('UPDATE version SET writes = writes + 1')
+
+    def version(self):
+        return self.connection().execute('SELECT writes FROM version').fetchone()[0]
+
+    def snapshot(self):
+        with self.transaction('DEFERRED') as connection:
+            version = connection.execute('SELECT writes FROM version').fetchone()[0]
+            return version, dict(connection.execute('SELECT key, value FROM items'))
+
+
+class Transaction(object):
+    def __init__(self, connection, mode):
+        self.connection = connection
+        self.mode = mode
+
+    def __enter__(self):
+        self.connection.execute('BEGIN ' + self.mode)
+        return self.connection
+
+    def __exit__(self, type, value, traceback):
+        self.connection.execute('COMMIT' if type is None else 'ROLLBACK')
@@ -3,17 +3,30 @@
 #----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
+import base64
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+import babel.dates
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import contains_eager, object_session
 from flask_migrate import Migrate
+import click
+import time
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from bulk import import_rows, export_rows, read_rows
+from cache import PageCache, backend_from_config
+from fsnd_common import instrumentation
+from fsnd_common.engine import configure_engine, pool_status
+import templating
+from templating import stream_template
+from routing import RoutingSQLAlchemy
 from datetime import datetime
+from itertools import groupby
+from functools import lru_cache
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -21,20 +34,25 @@ from datetime import datetime
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://Jacob@localhost:5432/fyyur'
+configure_engine(app)
+db = RoutingSQLAlchemy(app)
+replicas = db.replicas
 
 migrate = Migrate(app, db)
+instrumentation.init_app(app)
+page_cache = PageCache(backend_from_config(app.config), ttl=app.config['CACHE_TTL'])
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# a Postgres ARRAY; SQLite has none, there the list is stored as JSON text
+Genres = db.ARRAY(db.String).with_variant(db.JSON(), 'sqlite')
+
 class Venue(db.Model):
     __tablename__ = 'venue'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String())
+    name = db.Column(db.String(), nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
@@ -42,21 +60,33 @@ class Venue(db.Model):
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     # ADD Column below
-    genres = db.Column(db.ARRAY(db.String), nullable=True)
+    genres = db.Column(Genres, nullable=True)
     website = db.Column(db.String(), nullable=True)
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(), nullable=True)
 
+    # kept up to date by the show counters below
+    upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime(), nullable=True)
+
+    __table_args__ = (
+      db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+      db.Index('ix_venue_city_trgm', 'city', postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+      db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+      db.Index('ix_venue_city_state', 'city', 'state'),
+    )
+
 class Artist(db.Model):
     __tablename__ = 'artist'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String())
+    name = db.Column(db.String(), nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     # genres = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(Genres)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
@@ -65,32 +95,516 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String())
 
+    # kept up to date by the show counters below
+    upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime(), nullable=True)
+
+    __table_args__ = (
+      db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+      db.Index('ix_artist_city_trgm', 'city', postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+      db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+      db.Index('ix_artist_name_id', 'name', 'id'),
+    )
+
 class Show(db.Model):
   __tablename__ = 'show'
   id = db.Column(db.Integer, primary_key=True)
-  start_time = db.Column(db.DateTime())
+  # active_history: the show counters need the values a show is moved from,
+  # loaded even when the attribute was expired
+  start_time = db.column_property(db.Column(db.DateTime(), nullable=False), active_history=True)
 
   # foreign key relation
-  artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'))
-  venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'))
+  artist_id = db.column_property(db.Column(db.Integer, db.ForeignKey('artist.id'), nullable=False), active_history=True)
+  venue_id = db.column_property(db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False), active_history=True)
 
   artist = db.relationship("Artist", backref=db.backref('show', cascade='all, delete'))
   venue = db.relationship("Venue", backref=db.backref('show', cascade='all, delete'))
 
+  __table_args__ = (
+    db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_show_start_time_id', 'start_time', 'id'),
+  )
+
+# the last time roll_over_shows() ran, a single row
+show_rollover = db.Table('show_rollover',
+  db.Column('id', db.Integer, primary_key=True),
+  db.Column('rolled_at', db.DateTime(), nullable=False),
+)
+
+# the upcoming shows with what the /shows page renders of their venue and
+# artist, see the show feed below
+show_feed = db.Table('show_feed',
+  db.Column('show_id', db.Integer, primary_key=True),
+  db.Column('start_time', db.DateTime(), nullable=False),
+  db.Column('venue_id', db.Integer, nullable=False),
+  db.Column('venue_name', db.String()),
+  db.Column('artist_id', db.Integer, nullable=False),
+  db.Column('artist_name', db.String()),
+  db.Column('artist_image_link', db.String(500)),
+  db.Index('ix_show_feed_start_time_show_id', 'start_time', 'show_id'),
+  db.Index('ix_show_feed_venue_id', 'venue_id'),
+  db.Index('ix_show_feed_artist_id', 'artist_id'),
+)
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist keep upcoming_show_count, past_show_count and next_show_at
+# in step with every show inserted, moved or deleted through the ORM, the
+# cascade from deleting a venue or an artist included. A show counts as
+# upcoming when it starts at or after show_rollover.rolled_at, set when the
+# tables are created and by every run of roll_over_shows(), which moves the
+# shows started since into the past counts. So between runs a show that has
+# just started is still counted as upcoming; writing one with a start time
+# already past rolls the counters over at once.
+#
+# Core inserts (bulk import, bench seeding) bypass the ORM events, follow
+# them with reconcile_show_counts(fix=True).
+
+COUNTED = ((Venue.__table__, Show.venue_id), (Artist.__table__, Show.artist_id))
+
+@event.listens_for(show_rollover, 'after_create')
+def seed_rollover(table, connection, **kw):
+  # a new database counts its shows from now on, as the migration does
+  connection.execute(show_rollover.insert().values(id=1, rolled_at=datetime.now()))
+
+def rolled_at(connection, lock=None):
+  # lock='share' for writers counting a show, 'update' for the rollover, so
+  # no show is counted against a watermark that is moving
+  query = db.select([show_rollover.c.rolled_at]).where(show_rollover.c.id == 1)
+  if lock:
+    query = query.with_for_update(read=lock == 'share')
+  return connection.execute(query).scalar()
+
+def counting_since(connection, show):
+  # read once per transaction of the flushing session, the share lock holds
+  # until its end anyway
+  info = object_session(show).info
+  if 'show_rolled_at' not in info:
+    info['show_rolled_at'] = rolled_at(connection, lock='share')
+  return info['show_rolled_at']
+
+@event.listens_for(db.session, 'after_transaction_end')
+def forget_rolled_at(session, transaction):
+  if transaction.parent is None:
+    session.info.pop('show_rolled_at', None)
+    session.info.pop('show_roll_over', None)
+
+def set_rolled_at(connection, now):
+  if not connection.execute(show_rollover.update().where(show_rollover.c.id == 1).values(rolled_at=now)).rowcount:
+    connection.execute(show_rollover.insert().values(id=1, rolled_at=now))
+
+def next_show(key, entity_id, since):
+  # earliest show of an entity counted as upcoming
+  query = db.select([db.func.min(Show.start_time)]).where(key == entity_id)
+  if since is not None:
+    query = query.where(Show.start_time >= since)
+  return query.scalar_subquery()
+
+def add_show_counts(connection, since, start_time, entity_ids):
+  # entity_ids: the show's venue_id and artist_id, in the order of COUNTED
+  upcoming = since is None or start_time >= since
+  for (table, key), entity_id in zip(COUNTED, entity_ids):
+    if upcoming:
+      values = {
+        'upcoming_show_count': table.c.upcoming_show_count + 1,
+        'next_show_at': db.case(
+          (db.or_(table.c.next_show_at.is_(None), table.c.next_show_at > start_time), start_time),
+          else_=table.c.next_show_at),
+      }
+    else:
+      values = {'past_show_count': table.c.past_show_count + 1}
+    connection.execute(table.update().where(table.c.id == entity_id).values(values))
+
+def remove_show_counts(connection, since, start_time, entity_ids):
+  upcoming = since is None or start_time >= since
+  for (table, key), entity_id in zip(COUNTED, entity_ids):
+    if upcoming:
+      # the show row is gone or changed already, the subquery finds the
+      # entity's next show without it
+      values = {
+        'upcoming_show_count': table.c.upcoming_show_count - 1,
+        'next_show_at': db.case(
+          (table.c.next_show_at == start_time, next_show(key, entity_id, since)),
+          else_=table.c.next_show_at),
+      }
+    else:
+      values = {'past_show_count': table.c.past_show_count - 1}
+    connection.execute(table.update().where(table.c.id == entity_id).values(values))
+
+def roll_over_started(show, since):
+  # a show written with a start time already past counts as upcoming against
+  # the watermark: roll over to now at the end of the flush, which moves it
+  # to the past counts along with the other shows started since the last run
+  now = datetime.now()
+  if show.start_time < now and (since is None or show.start_time >= since):
+    object_session(show).info['show_roll_over'] = now
+
+@event.listens_for(db.session, 'after_flush')
+def roll_over_after_flush(session, flush_context):
+  now = session.info.pop('show_roll_over', None)
+  if now is not None:
+    roll_over(session.connection(), session, now)
+
+@event.listens_for(Show, 'after_insert')
+def count_show(mapper, connection, show):
+  since = counting_since(connection, show)
+  add_show_counts(connection, since, show.start_time, (show.venue_id, show.artist_id))
+  roll_over_started(show, since)
+
+@event.listens_for(Show, 'after_update')
+def recount_show(mapper, connection, show):
+  # a show moved in time or to another venue or artist: uncount it as it was,
+  # count it as it is
+  state = db.inspect(show)
+  old = {}
+  for name in ('start_time', 'venue_id', 'artist_id'):
+    history = state.attrs[name].history
+    old[name] = history.deleted[0] if history.deleted else getattr(show, name)
+  if (old['start_time'], old['venue_id'], old['artist_id']) == (show.start_time, show.venue_id, show.artist_id):
+    return
+  since = counting_since(connection, show)
+  remove_show_counts(connection, since, old['start_time'], (old['venue_id'], old['artist_id']))
+  add_show_counts(connection, since, show.start_time, (show.venue_id, show.artist_id))
+  roll_over_started(show, since)
+
+@event.listens_for(Show, 'after_delete')
+def uncount_show(mapper, connection, show):
+  remove_show_counts(connection, counting_since(connection, show), show.start_time, (show.venue_id, show.artist_id))
+
+def roll_over_shows(now=None):
+  '''
+  Moves the shows that started since the last run from the upcoming to the
+  past counts and advances next_show_at past them, in the current
+  transaction. Returns the number of shows moved.
+  '''
+  return roll_over(db.session.connection(), db.session, now or datetime.now())
+
+def roll_over(connection, session, now):
+  since = rolled_at(connection, lock='update')
+  started = Show.start_time < now
+  if since is not None:
+    started = db.and_(started, Show.start_time >= since)
+
+  moved = 0
+  for table, key in COUNTED:
+    counts = [{'entity_id': entity_id, 'moved': count} for entity_id, count in
+      connection.execute(db.select([key, db.func.count()]).where(started).group_by(key))]
+    if counts:
+      connection.execute(
+        table.update().where(table.c.id == db.bindparam('entity_id')).values(
+          upcoming_show_count=table.c.upcoming_show_count - db.bindparam('moved'),
+          past_show_count=table.c.past_show_count + db.bindparam('moved')),
+        counts)
+    # the same for both tables, each show has one venue and one artist
+    moved = sum(count['moved'] for count in counts)
+    connection.execute(table.update().where(table.c.next_show_at < now).values(
+      next_show_at=next_show(key, table.c.id, now)))
+  set_rolled_at(connection, now)
+  session.info['show_rolled_at'] = now
+  return moved
+
+def reconcile_show_counts(fix=False):
+  '''
+  Recounts the shows of every venue and artist against the last rollover,
+  returns (table name, id, stored, counted) for each entity whose
+  counters are off, and with fix=True overwrites them with the recount.
+  '''
+  connection = db.session.connection()
+  since = rolled_at(connection, lock='update' if fix else None)
+  if fix and since is None:
+    # never rolled over: count from now on
+    since = datetime.now()
+    set_rolled_at(connection, since)
+    db.session.info['show_rolled_at'] = since
+  # a venue or artist without shows joins one row of NULLs, not upcoming
+  upcoming = db.and_(Show.id.isnot(None), Show.start_time >= since if since is not None else db.true())
+  mismatches = []
+  for table, key in COUNTED:
+    query = db.select([
+      table.c.id, table.c.upcoming_show_count, table.c.past_show_count, table.c.next_show_at,
+      db.func.count(Show.id).label('shows'),
+      db.func.sum(db.case((upcoming, 1), else_=0)).label('upcoming'),
+      db.func.min(db.case((upcoming, Show.start_time))).label('next'),
+    ]).select_from(table.outerjoin(Show.__table__, key == table.c.id)).group_by(table.c.id)
+    for row in connection.execute(query):
+      counted = (row.upcoming or 0, row.shows - (row.upcoming or 0), row.next)
+      stored = (row.upcoming_show_count, row.past_show_count, row.next_show_at)
+      if stored != counted:
+        mismatches.append((table.name, row.id, stored, counted))
+    if fix:
+      fixes = [{'entity_id': id, 'upcoming': counted[0], 'past': counted[1], 'next': counted[2]}
+        for name, id, stored, counted in mismatches if name == table.name]
+      if fixes:
+        connection.execute(
+          table.update().where(table.c.id == db.bindparam('entity_id')).values(
+            upcoming_show_count=db.bindparam('upcoming'),
+            past_show_count=db.bindparam('past'),
+            next_show_at=db.bindparam('next')),
+          fixes)
+  return mismatches
+
+
+#----------------------------------------------------------------------------#
+# Show feed.
+#----------------------------------------------------------------------------#
+
+# show_feed holds one row per upcoming show, already joined with its venue
+# and artist, so a /shows page is one range scan of
+# ix_show_feed_start_time_show_id. The ORM events below keep it in step with
+# every show inserted, changed or deleted and every venue or artist renamed,
+# in the same transaction; prune_show_feed() drops the shows that have
+# started and refresh_show_feed() rebuilds it after Core inserts.
+#
+# A plain table on every database: a Postgres materialized view can only be
+# refreshed whole.
+
+FEED_COLUMNS = ['show_id', 'start_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link']
+
+def feed_rows(show_filter):
+  return db.select([Show.id, Show.start_time, Show.venue_id, Venue.name, Show.artist_id, Artist.name, Artist.image_link]) \
+    .select_from(Show.__table__.join(Venue.__table__).join(Artist.__table__)) \
+    .where(show_filter)
+
+@event.listens_for(Show, 'after_insert')
+def feed_show(mapper, connection, show):
+  connection.execute(show_feed.insert().from_select(
+    FEED_COLUMNS, feed_rows(db.and_(Show.id == show.id, Show.start_time >= datetime.now()))))
+
+@event.listens_for(Show, 'after_update')
+def refeed_show(mapper, connection, show):
+  connection.execute(show_feed.delete().where(show_feed.c.show_id == show.id))
+  feed_show(mapper, connection, show)
+
+@event.listens_for(Show, 'after_delete')
+def unfeed_show(mapper, connection, show):
+  connection.execute(show_feed.delete().where(show_feed.c.show_id == show.id))
+
+@event.listens_for(Venue, 'after_update')
+def refeed_venue(mapper, connection, venue):
+  if db.inspect(venue).attrs.name.history.has_changes():
+    connection.execute(show_feed.update().where(show_feed.c.venue_id == venue.id).values(venue_name=venue.name))
+
+@event.listens_for(Artist, 'after_update')
+def refeed_artist(mapper, connection, artist):
+  state = db.inspect(artist)
+  if state.attrs.name.history.has_changes() or state.attrs.image_link.history.has_changes():
+    connection.execute(show_feed.update().where(show_feed.c.artist_id == artist.id).values(
+      artist_name=artist.name, artist_image_link=artist.image_link))
+
+def prune_show_feed(now=None):
+  '''
+  Drops the shows that have started from the feed, returns how many.
+  '''
+  now = now or datetime.now()
+  return db.session.connection().execute(show_feed.delete().where(show_feed.c.start_time < now)).rowcount
+
+def refresh_show_feed(now=None):
+  '''
+  Rebuilds the feed from the show, venue and artist tables, in the current
+  transaction. Returns the number of upcoming shows.
+  '''
+  now = now or datetime.now()
+  connection = db.session.connection()
+  connection.execute(show_feed.delete())
+  return connection.execute(show_feed.insert().from_select(FEED_COLUMNS, feed_rows(Show.start_time >= now))).rowcount
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+  # compiled Babel pattern and parsed locale, once per (format, locale)
+  return babel.dates.parse_pattern(format), babel.Locale.parse(locale)
+
+@lru_cache(maxsize=16384)
+def cached_format_datetime(value, format, locale):
+  pattern, parsed_locale = datetime_pattern(format, locale)
+  return pattern.apply(value, parsed_locale)
+
+def format_datetime(value, format='medium', locale=babel.dates.LC_TIME):
+  # Formats a native datetime without going through a string, memoized per
+  # timestamp since shows cluster on the same start times. Strings are taken
+  # to be formatted already and pass through untouched.
+  if value is None or isinstance(value, str):
+    return value or ''
+  return cached_format_datetime(value, DATETIME_FORMATS.get(format, format), locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
+templating.init_app(app)
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def venue_areas():
+  # One query in (city, state) index order grouped in a single pass, loading
+  # only the columns the listing renders; the upcoming shows of an area add
+  # up the counters of its venues.
+  rows = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name, Venue.upcoming_show_count) \
+    .order_by(Venue.city, Venue.state, Venue.id) \
+    .yield_per(1000)
+
+  areas = []
+  for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    venues = list(venues)
+    areas.append({
+      'city': city,
+      'state': state,
+      'venues': [{'id': venue.id, 'name': venue.name, 'upcoming_shows_count': venue.upcoming_show_count}
+        for venue in venues],
+      'upcoming_shows_count': sum(venue.upcoming_show_count for venue in venues)
+    })
+  return areas
+
+GENRES = {genre.lower(): genre for genre, _ in VenueForm.genres.kwargs['choices']}
+
+def search(model, term, page=1, per_page=None):
+  # Case-insensitive match on name and city, or an exact (case-insensitive)
+  # genre (array containment on Postgres, a match of the quoted name in the
+  # JSON text on SQLite). Name prefix matches
+  # rank first, then name substring matches, then city/genre matches; on
+  # Postgres each band is ordered by trigram similarity. The pg_trgm GIN
+  # indexes serve the ILIKE filters, SQLite falls back to a scan.
+  per_page = min(per_page or app.config['SEARCH_PAGE_SIZE'], app.config['SEARCH_MAX_PAGE_SIZE'])
+  page = max(page, 1)
+  term = term.strip()
+  pattern = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+  postgres = db.engine.dialect.name == 'postgresql'
+  conditions = [
+    model.name.ilike('%' + pattern + '%', escape='\\'),
+    model.city.ilike('%' + pattern + '%', escape='\\'),
+  ]
+  if term.lower() in GENRES:
+    genre = GENRES[term.lower()]
+    if postgres:
+      conditions.append(model.genres.contains([genre]))
+    else:
+      conditions.append(db.cast(model.genres, db.String).like('%' + json.dumps(genre) + '%'))
+  query = db.session.query(model.id, model.name).filter(db.or_(*conditions))
+
+  order = [db.case(
+    (model.name.ilike(pattern + '%', escape='\\'), 0),
+    (conditions[0], 1),
+    else_=2)]
+  if postgres:
+    order.append(db.func.similarity(model.name, term).desc())
+  order += [model.name, model.id]
+
+  count = query.count()
+  return {
+    'count': count,
+    'page': page,
+    'pages': (count + per_page - 1) // per_page,
+    'data': query.order_by(*order).limit(per_page).offset((page - 1) * per_page).all()
+  }
+
+def encode_cursor(values):
+  return base64.urlsafe_b64encode(json.dumps(
+    [value.isoformat() if isinstance(value, datetime) else value for value in values]
+  ).encode()).decode()
+
+def decode_cursor(cursor, keys):
+  try:
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != len(keys):
+      abort(400)
+    return [
+      datetime.fromisoformat(value) if isinstance(key.type, db.DateTime) else value
+      for key, value in zip(keys, values)
+    ]
+  except (ValueError, TypeError):
+    abort(400)
+
+def keyset_page(query, keys, after=None, before=None, per_page=None):
+  # Seek pagination over unique, NOT NULL ordering keys: every page is one
+  # index range scan of per_page + 1 rows, however deep it is. The query must
+  # select the key columns by name. Returns the rows with opaque next/prev
+  # cursors (None at either end).
+  per_page = max(1, min(per_page or app.config['LISTING_PAGE_SIZE'], app.config['LISTING_MAX_PAGE_SIZE']))
+  position = db.tuple_(*keys)
+  if before:
+    query = query.filter(position < db.tuple_(*decode_cursor(before, keys))) \
+      .order_by(*[key.desc() for key in keys])
+  else:
+    if after:
+      query = query.filter(position > db.tuple_(*decode_cursor(after, keys)))
+    query = query.order_by(*keys)
+
+  rows = query.limit(per_page + 1).all()
+  more = len(rows) > per_page
+  rows = rows[:per_page]
+  if before:
+    rows.reverse()
+  has_next = more if not before else True
+  has_prev = more if before else bool(after)
+
+  def cursor(row):
+    return encode_cursor([getattr(row, key.key) for key in keys])
+
+  return {
+    'items': rows,
+    'next': cursor(rows[-1]) if rows and has_next else None,
+    'prev': cursor(rows[0]) if rows and has_prev else None,
+  }
+
+def listing_page(query, keys):
+  return keyset_page(
+    query, keys,
+    after=request.args.get('after'),
+    before=request.args.get('before'),
+    per_page=request.args.get('per_page', type=int)
+  )
+
+def show_timeline(show_filter, counterpart):
+  # Every show matching show_filter in one query with its counterpart
+  # relationship (Show.artist or Show.venue) joined eagerly, split into past
+  # and upcoming against a single timestamp.
+  now = datetime.now()
+  prefix = counterpart.key
+  shows = db.session.query(Show) \
+    .join(counterpart) \
+    .options(contains_eager(counterpart)) \
+    .filter(show_filter) \
+    .order_by(Show.start_time) \
+    .all()
+
+  past_shows = []
+  upcoming_shows = []
+  for show in shows:
+    other = getattr(show, prefix)
+    (past_shows if show.start_time < now else upcoming_shows).append({
+      prefix + '_id': other.id,
+      prefix + '_name': other.name,
+      prefix + '_image_link': other.image_link,
+      'start_time': show.start_time
+    })
+  return {
+    'past_shows': past_shows,
+    'upcoming_shows': upcoming_shows,
+    'past_shows_count': len(past_shows),
+    'upcoming_shows_count': len(upcoming_shows),
+  }
+
+def venue_tags(venue_id):
+  # cached pages showing this venue: its own, the listings (with their show
+  # counts) and the pages of the artists playing there
+  artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+  return ['venues', 'artists', 'shows', 'venue:{}'.format(venue_id)] + ['artist:{}'.format(id) for id, in artist_ids]
+
+def artist_tags(artist_id):
+  venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+  return ['artists', 'venues', 'shows', 'artist:{}'.format(artist_id)] + ['venue:{}'.format(id) for id, in venue_ids]
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -105,50 +619,24 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@replicas.read_only
+@page_cache.cached('venues')
 def venues():
-  data = []
-  city_result = Venue.query.distinct(Venue.city, Venue.state).all()
-  for result in city_result:
-    venues = Venue.query.filter(Venue.city == result.city, Venue.state == result.state).all()
-    data.append({
-      'city': result.city,
-      'state': result.state,
-      'venues': venues
-    })
-  return render_template('pages/venues.html', areas=data);
+  return Response(stream_template('pages/venues.html', areas=venue_areas()))
 
 @app.route('/venues/search', methods=['POST'])
+@replicas.read_only
 def search_venues():
-  search = request.form['search_term']
+  search_term = request.form.get('search_term', '')
+  data = search(Venue, search_term, page=request.form.get('page', 1, type=int))
 
-  data = {}
-  resp = Venue.query.filter(Venue.name.contains(search)).all()
-  data['count'] = len(resp)
-  data['data'] = resp
-
-  return render_template('pages/search_venues.html', results=data, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=data, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
+@replicas.read_only
+@page_cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   result = Venue.query.get(venue_id)
-  past_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id, datetime.now() > Show.start_time).all()
-  upcoming_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id, datetime.now() < Show.start_time).all()
-  past_show = []
-  upcoming_show = []
-  for show in past_shows:
-    past_show.append({
-      "artist_id": show.artist.id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": format_datetime(str(show.start_time))
-    })
-  for show in upcoming_shows:
-    upcoming_show.append({
-      "artist_id": show.artist.id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": format_datetime(str(show.start_time))
-    })
   data = {
     "id": result.id,
     "name": result.name,
@@ -162,11 +650,8 @@ def show_venue(venue_id):
     "seeking_talent": result.seeking_talent,
     "seeking_description": result.seeking_description,
     "image_link": result.image_link,
-    "upcoming_shows": upcoming_show,
-    "past_shows": past_show,
-    "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows),
   }
+  data.update(show_timeline(Show.venue_id == venue_id, Show.artist))
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
@@ -197,6 +682,7 @@ def create_venue_submission():
     )
     db.session.add(venue)
     db.session.commit()
+    page_cache.evict('venues')
     flash('Venue ' + form.name.data + ' was successfully listed!')
 
   except:
@@ -211,8 +697,10 @@ def create_venue_submission():
 def delete_venue(venue_id):
   try:
     venue = Venue.query.get(venue_id)
+    tags = venue_tags(venue_id)
     db.session.delete(venue)
     db.session.commit()
+    page_cache.evict(*tags)
     flash('Venue ' + venue.name + ' has been deleted')
   except:
     db.session.rollback()
@@ -224,44 +712,38 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@replicas.read_only
+@page_cache.cached('artists')
 def artists():
-  artist = Artist.query.all()
-
-  return render_template('pages/artists.html', artists=artist)
+  page = listing_page(
+    db.session.query(Artist.id, Artist.name, Artist.upcoming_show_count, Artist.next_show_at),
+    [Artist.name, Artist.id])
+  if request.args.get('format') == 'json':
+    return jsonify({
+      'artists': [{
+        'id': artist.id,
+        'name': artist.name,
+        'upcoming_shows_count': artist.upcoming_show_count,
+        'next_show_at': artist.next_show_at.isoformat() if artist.next_show_at else None,
+      } for artist in page['items']],
+      'next': page['next'],
+      'prev': page['prev'],
+    })
+  return render_template('pages/artists.html', artists=page['items'], page=page)
 
 @app.route('/artists/search', methods=['POST'])
+@replicas.read_only
 def search_artists():
-  search = request.form['search_term']
+  search_term = request.form.get('search_term', '')
+  data = search(Artist, search_term, page=request.form.get('page', 1, type=int))
 
-  data = {}
-  resp = Artist.query.filter(Artist.name.contains(search)).all()
-  data['count'] = len(resp)
-  data['data'] = resp
-
-  return render_template('pages/search_artists.html', results=data, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=data, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
+@replicas.read_only
+@page_cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
   artist = Artist.query.get(artist_id)
-  past_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id, datetime.now() > Show.start_time).all()
-  upcoming_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id, datetime.now() < Show.start_time).all()
-  past_show = []
-  upcoming_show = []
-  for show in past_shows:
-    past_show.append({
-      "venue_id": show.venue.id,
-      "venue_name": show.venue.name,
-      "venue_image_link": show.venue.image_link,
-      "start_time": format_datetime(str(show.start_time))
-    })
-  for show in upcoming_shows:
-    upcoming_show.append({
-      "venue_id": show.venue.id,
-      "venue_name": show.venue.name,
-      "venue_image_link": show.venue.image_link,
-      "start_time": format_datetime(str(show.start_time))
-    })
-
   data = {
     "id": artist.id,
     "name": artist.name,
@@ -274,11 +756,8 @@ def show_artist(artist_id):
     "seeking_venue": artist.seeking_venue,
     "seeking_description": artist.seeking_description,
     "image_link": artist.image_link,
-    "past_shows": past_show,
-    "upcoming_shows": upcoming_show,
-    "past_shows_count": len(past_show),
-    "upcoming_shows_count": len(upcoming_show),
   }
+  data.update(show_timeline(Show.artist_id == artist_id, Show.venue))
   return render_template('pages/show_artist.html', artist=data)
 
 #  Update
@@ -317,6 +796,7 @@ def edit_artist_submission(artist_id):
     artist.seeking_venue = form.seeking_venue.data
     artist.seeking_description = form.seeking_description.data
     db.session.commit()
+    page_cache.evict(*artist_tags(artist_id))
   except:
     db.session.rollback()
   finally:
@@ -359,6 +839,7 @@ def edit_venue_submission(venue_id):
     venue.seeking_description = form.seeking_description.data
 
     db.session.commit()
+    page_cache.evict(*venue_tags(venue_id))
   except:
     db.session.rollback()
   finally:
@@ -394,6 +875,7 @@ def create_artist_submission():
 
     db.session.add(artist)
     db.session.commit()
+    page_cache.evict('artists')
     flash('Artist ' + form.name.data + ' was successfully listed!')
 
   except:
@@ -409,19 +891,42 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@replicas.read_only
+@page_cache.cached('shows')
 def shows():
+  # upcoming shows from the precomputed feed, in start time order
+  query = db.session.query(show_feed)
+  if not request.args.get('after'):
+    # a next page starts past its cursor, which is upcoming already; two lower
+    # bounds would have SQLite scan from the first one
+    query = query.filter(show_feed.c.start_time >= datetime.now())
+  page = listing_page(query, [show_feed.c.start_time, show_feed.c.show_id])
+  if request.args.get('format') == 'json':
+    return jsonify({
+      'shows': [{
+        'id': item.show_id,
+        'start_time': item.start_time.isoformat(),
+        'venue_id': item.venue_id,
+        'venue_name': item.venue_name,
+        'artist_id': item.artist_id,
+        'artist_name': item.artist_name,
+        'artist_image_link': item.artist_image_link,
+      } for item in page['items']],
+      'next': page['next'],
+      'prev': page['prev'],
+    })
+
   datas = []
-  show = db.session.query(Show, Venue.name, Artist.name, Artist.image_link).outerjoin(Venue).outerjoin(Artist).order_by('id').all()
-  for item in show:
+  for item in page['items']:
     datas.append({
-      "venue_id": item[0].venue_id,
-      "venue_name": item[1],
-      "artist_id": item[0].artist_id,
-      "artist_name": item[2],
-      "artist_image_link": item[3],
-      "start_time": format_datetime(str(item[0].start_time))
+      "venue_id": item.venue_id,
+      "venue_name": item.venue_name,
+      "artist_id": item.artist_id,
+      "artist_name": item.artist_name,
+      "artist_image_link": item.artist_image_link,
+      "start_time": item.start_time
     })
-  return render_template('pages/shows.html', shows=datas)
+  return Response(stream_template('pages/shows.html', shows=datas, page=page))
 
 @app.route('/shows/create')
 def create_shows():
@@ -442,6 +947,7 @@ def create_show_submission():
 
     db.session.add(show)
     db.session.commit()
+    page_cache.evict('shows', 'venues', 'artists', 'venue:{}'.format(show.venue_id), 'artist:{}'.format(show.artist_id))
     flash('Show was successfully listed!')
 
   except:
@@ -452,6 +958,105 @@ def create_show_submission():
     db.session.close()
     return render_template('pages/home.html')
 
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(page_cache.stats())
+
+@app.route('/db/stats')
+def db_stats():
+  return jsonify(dict(pool_status(db.engine), replicas=replicas.status()))
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+BULK_MODELS = {'artist': Artist, 'venue': Venue, 'show': Show}
+
+@app.cli.command('import-data')
+@click.argument('table', type=click.Choice(sorted(BULK_MODELS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per transaction.')
+def import_data(table, path, batch_size):
+  '''Import rows from a .csv or .ndjson file into TABLE.'''
+  references = {}
+  if table == 'show':
+    # checked in memory instead of one lookup per row
+    references = {
+      'artist_id': {id for id, in db.session.query(Artist.id)},
+      'venue_id': {id for id, in db.session.query(Venue.id)},
+    }
+  imported, skipped = import_rows(db.engine, BULK_MODELS[table].__table__, read_rows(path),
+                                  batch_size=batch_size, references=references)
+  if table == 'show':
+    # the rows went in through Core, past the show counters and the feed
+    reconcile_show_counts(fix=True)
+    refresh_show_feed()
+    db.session.commit()
+  click.echo('Imported {} {} rows'.format(imported, table))
+  if skipped:
+    click.echo('Skipped {} rows with an unknown artist or venue, first at line {}'.format(
+      len(skipped), skipped[0]), err=True)
+
+@app.cli.command('export-data')
+@click.argument('table', type=click.Choice(sorted(BULK_MODELS)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--batch-size', default=5000, show_default=True, help='Rows fetched at a time.')
+def export_data(table, path, batch_size):
+  '''Export every row of TABLE to a .csv or .ndjson file.'''
+  exported = export_rows(db.engine, BULK_MODELS[table].__table__, path, batch_size=batch_size)
+  click.echo('Exported {} {} rows'.format(exported, table))
+
+@app.cli.command('compile-templates')
+def compile_templates_command():
+  '''Compile every template into the bytecode cache.'''
+  names = templating.compile_templates(app)
+  click.echo('Compiled {} templates into {}'.format(
+    len(names), getattr(app.jinja_env.bytecode_cache, 'directory', 'no cache')))
+
+@app.cli.command('roll-over-shows')
+@click.option('--every', type=float, help='Keep running, every this many seconds.')
+def roll_over_shows_command(every):
+  '''Move shows that have started to the past counts and out of the feed.'''
+  while True:
+    moved = roll_over_shows()
+    pruned = prune_show_feed()
+    db.session.commit()
+    if moved:
+      page_cache.evict('venues', 'artists')
+    if pruned:
+      page_cache.evict('shows')
+    click.echo('Moved {} shows to the past, {} out of the upcoming feed'.format(moved, pruned))
+    if not every:
+      break
+    time.sleep(every)
+
+@app.cli.command('refresh-show-feed')
+def refresh_show_feed_command():
+  '''Rebuild the upcoming shows feed.'''
+  upcoming = refresh_show_feed()
+  db.session.commit()
+  page_cache.evict('shows')
+  click.echo('{} upcoming shows in the feed'.format(upcoming))
+
+@app.cli.command('reconcile-show-counts')
+@click.option('--fix', is_flag=True, help='Overwrite the counters that are off.')
+def reconcile_show_counts_command(fix):
+  '''Check the venue and artist show counters against a full recount.'''
+  mismatches = reconcile_show_counts(fix=fix)
+  db.session.commit()
+  for name, id, stored, counted in mismatches[:20]:
+    click.echo('{} {}: stored {} counted {} (upcoming, past, next show)'.format(name, id, stored, counted), err=True)
+  if len(mismatches) > 20:
+    click.echo('... {} more'.format(len(mismatches) - 20), err=True)
+  if fix:
+    if mismatches:
+      page_cache.evict('venues', 'artists')
+    click.echo('Fixed {} counters'.format(len(mismatches)))
+  elif mismatches:
+    raise SystemExit(1)
+  else:
+    click.echo('All counters match')
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
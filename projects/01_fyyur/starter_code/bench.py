@@ -0,0 +1,332 @@
+'''
+Benchmarks for the Fyyur views.
+
+    BENCH_DATABASE_URL=postgresql://localhost:5432/fyyur_bench python bench.py venues
+    BENCH_DATABASE_URL=sqlite:////tmp/fyyur_bench.db python bench.py feed
+
+!!NOTE every benchmark drops and re-creates the tables of the target database,
+never point it at the real fyyur database.
+'''
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+import babel.dates
+import tempfile
+import dateutil.parser
+from sqlalchemy import event
+
+from bulk import import_rows, export_rows, read_rows
+from fsnd_common.engine import configure_engine
+from templating import AtomicBytecodeCache, template_stream
+from flask import render_template
+from app import app, db, Venue, Artist, Show, venue_areas, show_timeline, search, keyset_page, encode_cursor, \
+  format_datetime, cached_format_datetime, reconcile_show_counts, show_feed, refresh_show_feed
+
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+  'BENCH_DATABASE_URL', 'postgresql://localhost:5432/fyyur_bench')
+# seeding and benchmarks run long statements
+app.config['DATABASE_POOL_PROFILE'] = 'worker'
+configure_engine(app)
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+class QueryCounter(object):
+  '''
+  Counts the statements sent to the database inside a with block.
+  '''
+  def __init__(self):
+    self.count = 0
+
+  def _count(self, *args, **kwargs):
+    self.count += 1
+
+  def __enter__(self):
+    event.listen(db.engine, 'before_cursor_execute', self._count)
+    return self
+
+  def __exit__(self, *exc):
+    event.remove(db.engine, 'before_cursor_execute', self._count)
+
+
+def measure(fn, repeat=5):
+  '''
+  Returns (best wall time in ms, statements per call) for fn().
+  '''
+  best = None
+  for _ in range(repeat):
+    db.session.expire_all()
+    with QueryCounter() as counter:
+      start = time.perf_counter()
+      fn()
+      elapsed = (time.perf_counter() - start) * 1000
+    best = elapsed if best is None else min(best, elapsed)
+  return best, counter.count
+
+
+def report(name, fn, repeat=5):
+  elapsed, queries = measure(fn, repeat)
+  print('{:<32} {:>10.1f} ms {:>8} queries'.format(name, elapsed, queries))
+
+
+def report_latency(name, fn, calls):
+  '''
+  Prints the p50/p99 latency of fn(*args) over the argument tuples in calls.
+  '''
+  timings = []
+  for args in calls:
+    start = time.perf_counter()
+    fn(*args)
+    timings.append((time.perf_counter() - start) * 1000)
+  timings.sort()
+  print('{:<32} p50 {:>8.2f} ms  p99 {:>8.2f} ms'.format(
+    name, timings[len(timings) // 2], timings[int(len(timings) * 0.99)]))
+
+
+def reset_db():
+  db.session.remove()
+  db.drop_all()
+  if db.engine.dialect.name == 'postgresql':
+    db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    db.session.commit()
+  db.create_all()
+
+
+def insert_batches(table, rows, batch_size=50000):
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) == batch_size:
+      db.session.execute(table.insert(), batch)
+      batch = []
+  if batch:
+    db.session.execute(table.insert(), batch)
+
+
+def seed(venues=0, artists=0, shows=0, cities=500, upcoming=0.5):
+  '''
+  Bulk inserts synthetic rows, one show an hour with the given fraction upcoming.
+  '''
+  past = int(shows * (1 - upcoming))
+  now = datetime.now()
+  insert_batches(Venue.__table__, ({
+    'name': 'Venue {}'.format(i),
+    'city': 'City {}'.format(i % cities),
+    'state': 'S{}'.format(i % 50),
+    'genres': ['Jazz'],
+  } for i in range(venues)))
+  insert_batches(Artist.__table__, ({
+    'name': 'Artist {}'.format(i),
+    'city': 'City {}'.format(i % cities),
+    'state': 'S{}'.format(i % 50),
+    'genres': ['Rock'],
+  } for i in range(artists)))
+  insert_batches(Show.__table__, ({
+    'venue_id': i % venues + 1,
+    'artist_id': i % artists + 1,
+    'start_time': now + timedelta(hours=i - past),
+  } for i in range(shows)))
+  reconcile_show_counts(fix=True)
+  refresh_show_feed()
+  db.session.commit()
+
+#----------------------------------------------------------------------------#
+# Benchmarks.
+#----------------------------------------------------------------------------#
+
+def legacy_venue_areas():
+  # the /venues query pattern before the grouped listing
+  data = []
+  for result in Venue.query.distinct(Venue.city, Venue.state).all():
+    venues = Venue.query.filter(Venue.city == result.city, Venue.state == result.state).all()
+    data.append({'city': result.city, 'state': result.state, 'venues': venues})
+  return data
+
+
+def bench_venues():
+  reset_db()
+  seed(venues=10000, artists=1000, shows=20000, cities=500)
+  report('venues: per-area queries', legacy_venue_areas)
+  report('venues: grouped listing', venue_areas)
+
+
+def legacy_venue_shows(venue_id):
+  # the /venues/<id> query pattern before the show timeline loader
+  now = datetime.now()
+  shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id, now > Show.start_time).all() \
+    + db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id, now < Show.start_time).all()
+  return [(show.artist.id, show.artist.name, show.artist.image_link) for show in shows]
+
+
+def bench_show_venue():
+  reset_db()
+  seed(venues=10, artists=50000, shows=50000)
+  report('show_venue: lazy counterparts', lambda: legacy_venue_shows(1))
+  report('show_venue: show timeline', lambda: show_timeline(Show.venue_id == 1, Show.artist))
+
+
+def bench_search():
+  reset_db()
+  seed(venues=1000000, artists=1000000, shows=0, cities=5000)
+  if db.engine.dialect.name == 'postgresql':
+    db.session.execute('ANALYZE')
+  rng = random.Random(0)
+  terms = ['Artist {}'.format(rng.randrange(1000000))[:rng.randint(8, 13)] for _ in range(200)] \
+    + ['city {}'.format(rng.randrange(5000)) for _ in range(100)]
+  report_latency('search: legacy contains', lambda term: Artist.query.filter(Artist.name.contains(term)).all(),
+                 [(term,) for term in terms])
+  report_latency('search: ranked, first page', lambda term: search(Artist, term), [(term,) for term in terms])
+  report_latency('search: ranked, page 5', lambda term: search(Artist, term, page=5), [(term,) for term in terms])
+
+
+def bench_shows():
+  reset_db()
+  seed(venues=1000, artists=10000, shows=1000000)
+  query = db.session.query(Show.id, Show.start_time, Venue.name.label('venue_name'),
+                           Artist.name.label('artist_name')).outerjoin(Venue).outerjoin(Artist)
+  keys = [Show.start_time, Show.id]
+  middle = db.session.query(Show.start_time, Show.id).order_by(*keys).offset(500000).first()
+  report('shows: every row', lambda: query.order_by(Show.id).all(), repeat=1)
+  report('shows: first page', lambda: keyset_page(query, keys))
+  report('shows: page at row 500k', lambda: keyset_page(query, keys, after=encode_cursor(middle)))
+  report('shows: offset to row 500k', lambda: query.order_by(*keys).offset(500000).limit(30).all())
+
+
+def bench_feed(shows=5000000):
+  reset_db()
+  seed(venues=10000, artists=100000, shows=shows)
+  now = datetime.now()
+  upcoming = db.session.query(show_feed.c.start_time, show_feed.c.show_id).count()
+  deep = upcoming // 2
+  # the three-way join /shows ran before the feed, and the feed; next pages
+  # drop the start time bound as the view does
+  join = db.session.query(Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'), Show.artist_id,
+                          Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link')) \
+    .outerjoin(Venue).outerjoin(Artist)
+  join_keys = [Show.start_time, Show.id]
+  feed = db.session.query(show_feed)
+  feed_keys = [show_feed.c.start_time, show_feed.c.show_id]
+  middle = db.session.query(*feed_keys).filter(show_feed.c.start_time >= now).order_by(*feed_keys).offset(deep).first()
+
+  report('feed: full refresh', refresh_show_feed, repeat=1)
+  db.session.commit()
+  report('shows: join, first page', lambda: keyset_page(join.filter(Show.start_time >= now), join_keys))
+  report('shows: feed, first page', lambda: keyset_page(feed.filter(show_feed.c.start_time >= now), feed_keys))
+  report('shows: join, page at {}'.format(deep), lambda: keyset_page(join, join_keys, after=encode_cursor(middle)))
+  report('shows: feed, page at {}'.format(deep), lambda: keyset_page(feed, feed_keys, after=encode_cursor(middle)))
+
+  # what the incremental refresh adds to a write, rolled back every time
+  def add_show():
+    db.session.add(Show(venue_id=1, artist_id=1, start_time=now + timedelta(days=1)))
+    db.session.flush()
+    db.session.rollback()
+
+  def rename_artist():
+    Artist.query.get(1).name = 'Renamed'
+    db.session.flush()
+    db.session.rollback()
+
+  report('feed: insert a show', add_show)
+  report('feed: rename an artist', rename_artist)
+
+
+def bench_import(shows=1000000):
+  # import-data and export-data of the show table through a CSV file
+  reset_db()
+  seed(venues=1000, artists=10000)
+  now = datetime.now()
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'shows.csv')
+    with open(path, 'w') as f:
+      f.write('artist_id,venue_id,start_time\n')
+      for i in range(shows):
+        f.write('{},{},{}\n'.format(i % 10000 + 1, i % 1000 + 1, (now + timedelta(hours=i)).isoformat()))
+    references = {'artist_id': set(range(1, 10001)), 'venue_id': set(range(1, 1001))}
+    report('import: {} shows'.format(shows), lambda: import_rows(
+      db.engine, Show.__table__, read_rows(path), batch_size=20000, references=references), repeat=1)
+    report('import: recount and feed', lambda: (reconcile_show_counts(fix=True), refresh_show_feed()), repeat=1)
+    db.session.commit()
+    report('export: {} shows'.format(shows), lambda: export_rows(
+      db.engine, Show.__table__, os.path.join(directory, 'out.csv'), batch_size=20000), repeat=1)
+
+
+def legacy_format_datetime(value, format='medium'):
+  # the datetime filter before it took native datetimes
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+    format = "EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+    format = "EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+
+def bench_format():
+  now = datetime.now().replace(minute=0, second=0, microsecond=0)
+  # 100k shows starting on the hour over roughly the next year
+  start_times = [now + timedelta(hours=i % 9000) for i in range(100000)]
+  report('format: str, parse, format x2',
+         lambda: [legacy_format_datetime(legacy_format_datetime(str(value)), 'full') for value in start_times], 1)
+  cached_format_datetime.cache_clear()
+  report('format: native, cold cache', lambda: [format_datetime(value, 'full') for value in start_times], 1)
+  report('format: native, warm cache', lambda: [format_datetime(value, 'full') for value in start_times], 1)
+
+
+def bench_templates():
+  names = app.jinja_env.list_templates(extensions=['html'])
+
+  # a worker's first use of every template: a new environment, compiling
+  # from source or loading what an earlier process compiled
+  def load_all(cache):
+    env = app.jinja_env.overlay(bytecode_cache=cache, cache_size=400)
+    for name in names:
+      env.get_template(name)
+
+  with tempfile.TemporaryDirectory() as directory:
+    cache = AtomicBytecodeCache(directory)
+    report('templates: cold, compile all', lambda: load_all(None))
+    load_all(cache)
+    report('templates: cold, bytecode cache', lambda: load_all(cache))
+
+  now = datetime.now()
+  shows = [{
+    'venue_id': i, 'venue_name': 'Venue {}'.format(i), 'artist_id': i, 'artist_name': 'Artist {}'.format(i),
+    'artist_image_link': 'https://example.com/{}.jpg'.format(i), 'start_time': now + timedelta(hours=i),
+  } for i in range(100)]
+  areas = [{
+    'city': 'City {}'.format(i), 'state': 'S{}'.format(i % 50), 'upcoming_shows_count': i,
+    'venues': [{'id': j, 'name': 'Venue {}'.format(j)} for j in range(i * 20, i * 20 + 20)],
+  } for i in range(500)]
+  page = {'prev': None, 'next': None}
+
+  def first_chunk(chunks):
+    return next(iter(chunks))
+
+  with app.test_request_context('/shows'):
+    report('render: shows x100', lambda: render_template('pages/shows.html', shows=shows, page=page), 20)
+    report('stream: shows x100, first chunk', lambda: first_chunk(template_stream('pages/shows.html', shows=shows, page=page)), 20)
+    report('stream: shows x100, whole page', lambda: ''.join(template_stream('pages/shows.html', shows=shows, page=page)), 20)
+  with app.test_request_context('/venues'):
+    report('render: venues 500x20', lambda: render_template('pages/venues.html', areas=areas), 20)
+    report('stream: venues 500x20, first chunk', lambda: first_chunk(template_stream('pages/venues.html', areas=areas)), 20)
+    report('stream: venues 500x20, whole page', lambda: ''.join(template_stream('pages/venues.html', areas=areas)), 20)
+
+
+BENCHMARKS = {
+  'venues': bench_venues,
+  'show_venue': bench_show_venue,
+  'search': bench_search,
+  'shows': bench_shows,
+  'feed': bench_feed,
+  'import': bench_import,
+  'format': bench_format,
+  'templates': bench_templates,
+}
+
+if __name__ == '__main__':
+  names = sys.argv[1:] or sorted(BENCHMARKS)
+  with app.app_context():
+    for name in names:
+      BENCHMARKS[name]()
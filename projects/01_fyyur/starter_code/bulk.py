@@ -0,0 +1,174 @@
+'''
+Streaming bulk import and export of table rows as CSV or NDJSON.
+
+Files are read and written row by row and sent to the database in batches:
+COPY ... FROM STDIN on Postgres, executemany everywhere else. In CSV files
+ARRAY cells (genres) hold a JSON list, e.g. ["Jazz", "Folk"].
+'''
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import ARRAY, JSON, Boolean, DateTime, Integer, select
+
+
+def file_format(path):
+  if path.endswith('.csv'):
+    return 'csv'
+  if path.endswith(('.ndjson', '.jsonl')):
+    return 'ndjson'
+  raise ValueError('{}: expected a .csv, .ndjson or .jsonl file'.format(path))
+
+
+def read_rows(path):
+  '''
+  Yields the rows of a CSV or NDJSON file as dicts, skipping blank lines.
+  '''
+  with open(path, newline='') as f:
+    if file_format(path) == 'csv':
+      for row in csv.DictReader(f):
+        yield row
+    else:
+      for line in f:
+        if line.strip():
+          yield json.loads(line)
+
+
+def coerce(table, row):
+  '''
+  Converts the values of one input row to the python types of the table
+  columns, dropping keys that are not columns. Empty strings become None.
+  '''
+  values = {}
+  for name, value in row.items():
+    if name not in table.c:
+      continue
+    # a variant (genres) converts as its base type
+    column_type = table.c[name].type
+    column_type = getattr(column_type, 'impl', column_type)
+    if value == '' or value is None:
+      value = None
+    elif not isinstance(value, str):
+      pass
+    elif isinstance(column_type, (ARRAY, JSON)):
+      value = json.loads(value)
+    elif isinstance(column_type, Integer):
+      value = int(value)
+    elif isinstance(column_type, Boolean):
+      value = value.lower() in ('1', 't', 'true', 'y', 'yes')
+    elif isinstance(column_type, DateTime):
+      value = datetime.fromisoformat(value)
+    values[name] = value
+  return values
+
+
+def batches(rows, size):
+  rows = iter(rows)
+  while True:
+    batch = list(islice(rows, size))
+    if not batch:
+      return
+    yield batch
+
+
+def copy_value(value):
+  # text a Postgres COPY ... CSV accepts for value, None is the unquoted NULL
+  if isinstance(value, list):
+    return '{' + ','.join(
+      '"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value
+    ) + '}'
+  if isinstance(value, bool):
+    return 't' if value else 'f'
+  if isinstance(value, datetime):
+    return value.isoformat()
+  return value
+
+
+def copy_batch(connection, table, columns, batch):
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for row in batch:
+    writer.writerow([copy_value(row.get(column)) for column in columns])
+  buffer.seek(0)
+  cursor = connection.connection.cursor()
+  cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH CSV'.format(
+    table.name, ', '.join('"{}"'.format(column) for column in columns)), buffer)
+
+
+def import_rows(engine, table, rows, batch_size=5000, references=None):
+  '''
+  Inserts rows (dicts of column values) into table, committing once per batch.
+
+  references maps a foreign key column to the set of ids it may hold; rows
+  pointing anywhere else are skipped instead of failing the batch.
+  Returns (imported, skipped line numbers).
+  '''
+  references = references or {}
+  skipped = []
+
+  def valid(rows):
+    for line, row in enumerate(rows, 1):
+      row = coerce(table, row)
+      if all(row.get(column) in ids for column, ids in references.items()):
+        yield row
+      else:
+        skipped.append(line)
+
+  postgres = engine.dialect.name == 'postgresql'
+  imported = 0
+  for batch in batches(valid(rows), batch_size):
+    columns = sorted(set().union(*batch))
+    with engine.begin() as connection:
+      if postgres:
+        copy_batch(connection, table, columns, batch)
+      else:
+        connection.execute(table.insert(), [{column: row.get(column) for column in columns} for row in batch])
+    imported += len(batch)
+
+  if postgres and 'id' in table.c and imported:
+    # explicit ids bypass the serial sequence, move it past them
+    with engine.begin() as connection:
+      connection.execute(
+        "SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), "
+        "coalesce((SELECT max(id) FROM \"{0}\"), 1))".format(table.name))
+  return imported, skipped
+
+
+def export_value(value, csv_file):
+  if isinstance(value, datetime):
+    return value.isoformat()
+  if csv_file and isinstance(value, list):
+    return json.dumps(value)
+  return value
+
+
+def export_rows(engine, table, path, batch_size=5000):
+  '''
+  Streams every row of table, in id order, to a CSV or NDJSON file with a
+  server side cursor. Returns the number of rows written.
+  '''
+  csv_file = file_format(path) == 'csv'
+  columns = [column.name for column in table.c]
+  query = select([table])
+  if 'id' in table.c:
+    query = query.order_by(table.c.id)
+
+  exported = 0
+  with engine.connect() as connection, open(path, 'w', newline='') as f:
+    writer = csv.writer(f) if csv_file else None
+    if csv_file:
+      writer.writerow(columns)
+    result = connection.execution_options(stream_results=True).execute(query)
+    while True:
+      batch = result.fetchmany(batch_size)
+      if not batch:
+        break
+      for row in batch:
+        values = [export_value(value, csv_file) for value in row]
+        if csv_file:
+          writer.writerow(values)
+        else:
+          f.write(json.dumps(dict(zip(columns, values))) + '\n')
+      exported += len(batch)
+  return exported
@@ -0,0 +1,144 @@
+'''
+Page cache for the read views.
+
+Rendered responses are stored under a key built from the request path and
+the current version of every entity tag the page depends on ('venues',
+'venue:3', ...). evict() bumps the version of a tag, so every page rendered
+from it is missed from then on and ages out of the backend on its own.
+'''
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, g, make_response, request, session
+
+
+class LRUCache(object):
+  '''
+  In-process backend: least recently used entries beyond max_entries are
+  dropped, and entries expire after their ttl. Tag versions are kept apart
+  from the entries so they are never evicted.
+  '''
+  def __init__(self, max_entries=1024):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.counters = {}
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      if key in self.counters:
+        return str(self.counters[key]).encode()
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      value, expires = entry
+      if expires < time.monotonic():
+        del self.entries[key]
+        return None
+      self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl):
+    with self.lock:
+      self.entries[key] = (value, time.monotonic() + ttl)
+      self.entries.move_to_end(key)
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+
+  def incr(self, key):
+    with self.lock:
+      self.counters[key] = self.counters.get(key, 0) + 1
+      return self.counters[key]
+
+
+class RedisCache(object):
+  '''
+  Shared backend over a redis-py compatible client (redis.Redis, fakeredis
+  or anything with get, set(ex=) and incr).
+  '''
+  def __init__(self, client):
+    self.client = client
+
+  def get(self, key):
+    return self.client.get(key)
+
+  def set(self, key, value, ttl):
+    self.client.set(key, value, ex=ttl)
+
+  def incr(self, key):
+    return self.client.incr(key)
+
+
+def backend_from_config(config):
+  '''
+  RedisCache when CACHE_REDIS_URL is set (needs the redis package),
+  otherwise an LRUCache of CACHE_MAX_ENTRIES.
+  '''
+  if config.get('CACHE_REDIS_URL'):
+    import redis
+    return RedisCache(redis.Redis.from_url(config['CACHE_REDIS_URL']))
+  return LRUCache(config.get('CACHE_MAX_ENTRIES', 1024))
+
+
+class PageCache(object):
+  def __init__(self, backend=None, ttl=60, prefix='fyyur:'):
+    self.backend = backend or LRUCache()
+    self.ttl = ttl
+    self.prefix = prefix
+    self.hits = 0
+    self.misses = 0
+
+  def stats(self):
+    return {'hits': self.hits, 'misses': self.misses}
+
+  def version(self, tag):
+    return int(self.backend.get(self.prefix + 'version:' + tag) or 0)
+
+  def evict(self, *tags):
+    for tag in tags:
+      self.backend.incr(self.prefix + 'version:' + tag)
+
+  def cached(self, *tags):
+    '''
+    Caches the successful responses of a view. tags are formatted with the
+    view arguments, e.g. 'venue:{venue_id}'.
+    '''
+    def decorator(f):
+      @wraps(f)
+      def wrapper(*args, **kwargs):
+        # a pending flash message is rendered into the page, never cache it
+        if '_flashes' in session:
+          return f(*args, **kwargs)
+        # a client reading its own writes must not get a page rendered from
+        # a replica that had not caught up yet
+        if g.get('read_your_writes'):
+          return f(*args, **kwargs)
+
+        key = self.prefix + 'page:' + request.full_path + ':' + ','.join(
+          '{}@{}'.format(tag, self.version(tag)) for tag in (tag.format(**kwargs) for tag in tags))
+        entry = self.backend.get(key)
+        if entry is not None:
+          self.hits += 1
+          mimetype, body = entry.split(b'\n', 1)
+          return Response(body, mimetype=mimetype.decode())
+
+        self.misses += 1
+        response = make_response(f(*args, **kwargs))
+        if response.status_code != 200:
+          return response
+        if response.is_streamed:
+          # stored once the last chunk went out, streaming is not held up
+          response.response = self.tee(key, response.mimetype, response.response)
+        else:
+          self.backend.set(key, response.mimetype.encode() + b'\n' + response.get_data(), self.ttl)
+        return response
+      return wrapper
+    return decorator
+
+  def tee(self, key, mimetype, chunks):
+    body = []
+    for chunk in chunks:
+      body.append(chunk.encode() if isinstance(chunk, str) else chunk)
+      yield chunk
+    self.backend.set(key, mimetype.encode() + b'\n' + b''.join(body), self.ttl)
@@ -1,5 +1,4 @@
 import os
-SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -7,7 +6,50 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 DEBUG = True
 
 # Connect to the database
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://Jacob@localhost:5432/fyyur')
 
+# Connection pool: a profile of fsnd_common.engine.PROFILES (web, worker or
+# test), None for worker under the flask command (migrations, imports) except
+# flask run and web otherwise; any DATABASE_POOL_* setting here or in the
+# environment overrides the profile
+DATABASE_POOL_PROFILE = None
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+# Read replicas for the read-only views, comma separated in the environment;
+# seconds between replica health checks, and how long a client that wrote
+# keeps reading from the primary
+DATABASE_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+REPLICA_CHECK_INTERVAL = 5
+REPLICA_STICKY_SECONDS = 10
+
+# Signs the session cookie, which carries the read-your-writes deadline when
+# replicas are configured: then set SECRET_KEY in the environment, the same
+# for every worker, or a worker that did not take the write cannot read it.
+# Without replicas a key per process will do.
+SECRET_KEY = os.environ.get('SECRET_KEY') or (None if DATABASE_REPLICA_URLS else os.urandom(32))
+
+
+# Compiled templates are kept on disk, in JINJA_CACHE_DIR or a per-user
+# directory under the system temp dir, for every worker and restart. Template
+# files are only checked for changes with TEMPLATES_AUTO_RELOAD (development)
+JINJA_BYTECODE_CACHE = True
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR')
+TEMPLATES_AUTO_RELOAD = os.environ.get('FLASK_ENV') == 'development'
+
+# Search results per page, and the most a caller may ask for
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Rows per page of the /artists and /shows listings, and the most a caller may ask for
+LISTING_PAGE_SIZE = 30
+LISTING_MAX_PAGE_SIZE = 100
+
+# Page cache for the read views: seconds a page is kept, in-process LRU size,
+# or a redis:// URL to share the cache between workers
+CACHE_TTL = 60
+CACHE_MAX_ENTRIES = 1024
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+# Fail any request issuing more SQL statements than this (None to disable),
+# and warn about a statement repeated this many times in one request
+SQL_QUERY_BUDGET = None
+SQL_REPEAT_THRESHOLD = 5
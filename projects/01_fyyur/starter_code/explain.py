@@ -0,0 +1,112 @@
+'''
+Checks that the Fyyur read views are served by indexes.
+
+    BENCH_DATABASE_URL=postgresql://localhost:5432/fyyur_bench python explain.py
+
+Seeds the benchmark database (see bench.py), requests every read view and runs
+EXPLAIN on each statement the view issued. Exits with status 1 if any plan
+still has a sequential scan that is not listed in ALLOWED_SCANS.
+'''
+import re
+import sys
+from sqlalchemy import event
+
+from bench import app, db, reset_db, seed
+
+# (path, table) pairs that read the whole table by design
+ALLOWED_SCANS = {
+  'postgresql': {
+    ('/venues', 'venue'),
+  },
+  # no trigram indexes on SQLite, search falls back to a scan
+  'sqlite': {
+    ('/venues', 'venue'),
+    ('/venues/search', 'venue'),
+    ('/artists/search', 'artist'),
+  },
+}
+
+
+def capture(fn):
+  '''
+  Returns the (statement, parameters) sent to the database while fn() runs.
+  '''
+  statements = []
+
+  def record(conn, cursor, statement, parameters, context, executemany):
+    statements.append((statement, parameters))
+
+  event.listen(db.engine, 'before_cursor_execute', record)
+  try:
+    fn()
+  finally:
+    event.remove(db.engine, 'before_cursor_execute', record)
+  return statements
+
+
+def explain(statement, parameters):
+  '''
+  Returns (tables read by a sequential scan, plan lines) for the statement.
+  '''
+  connection = db.engine.raw_connection()
+  try:
+    cursor = connection.cursor()
+    if db.engine.dialect.name == 'postgresql':
+      cursor.execute('EXPLAIN ' + statement, parameters)
+      plan = [row[0] for row in cursor.fetchall()]
+      return re.findall(r'Seq Scan on (\w+)', '\n'.join(plan)), plan
+
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    plan = [row[-1] for row in cursor.fetchall()]
+  finally:
+    connection.close()
+  scans = [match.group(1) for match in (re.match(r'SCAN (\w+)$', line) for line in plan) if match]
+  return [table for table in scans if not table.startswith('anon_')], plan
+
+
+def views(client):
+  '''
+  Yields (path, request function) for every read view, one page deep.
+  '''
+  shows = client.get('/shows?format=json').get_json()
+  artists = client.get('/artists?format=json').get_json()
+  yield '/venues', lambda: client.get('/venues')
+  yield '/venues/<id>', lambda: client.get('/venues/1')
+  yield '/artists', lambda: client.get('/artists')
+  yield '/artists?after', lambda: client.get('/artists', query_string={'after': artists['next']})
+  yield '/artists/<id>', lambda: client.get('/artists/1')
+  yield '/shows', lambda: client.get('/shows')
+  yield '/shows?after', lambda: client.get('/shows', query_string={'after': shows['next']})
+  yield '/venues/search', lambda: client.post('/venues/search', data={'search_term': 'venue 123'})
+  yield '/artists/search', lambda: client.post('/artists/search', data={'search_term': 'artist 123'})
+
+
+def main():
+  reset_db()
+  # mostly past shows, as in a long running deployment
+  seed(venues=20000, artists=20000, shows=200000, cities=2000, upcoming=0.05)
+  if db.engine.dialect.name == 'postgresql':
+    db.session.execute('ANALYZE')
+    db.session.commit()
+
+  allowed = ALLOWED_SCANS.get(db.engine.dialect.name, set())
+  failed = False
+  for path, fetch in views(app.test_client()):
+    clean = True
+    for statement, parameters in capture(fetch):
+      tables, plan = explain(statement, parameters)
+      tables = [table for table in tables if (path, table) not in allowed]
+      if tables:
+        clean, failed = False, True
+        print('FAIL {} scans {}'.format(path, ', '.join(tables)))
+        print('  ' + ' '.join(statement.split()))
+        for line in plan:
+          print('    ' + line)
+    if clean:
+      print('ok   {}'.format(path))
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  with app.app_context():
+    sys.exit(main())
@@ -0,0 +1,87 @@
+'''
+Load test of the Fyyur read views at several worker counts.
+
+    BENCH_DATABASE_URL=postgresql://localhost:5432/fyyur_bench python loadtest.py 1 4 16 64
+
+Seeds the benchmark database (see bench.py), then for each worker count runs
+that many threads requesting the read views for LOADTEST_SECONDS, with the
+page cache off so every request reaches the database. Prints throughput,
+latency and what the connection pool went through; DATABASE_POOL_* settings
+(see fsnd_common.engine) are read as usual, so pool sizes can be compared
+too. The pool is bench.py's, the worker profile, so set
+DATABASE_POOL_PROFILE=web to measure the one the web workers get.
+'''
+import os
+import random
+import sys
+import threading
+import time
+
+from bench import app, db, reset_db, seed
+from fsnd_common.engine import pool_status
+import app as fyyur
+
+SECONDS = float(os.environ.get('LOADTEST_SECONDS', 5))
+PATHS = ['/venues', '/venues/{}', '/artists', '/artists/{}', '/shows']
+
+
+def worker(stop, latencies, errors, ids):
+  client = app.test_client()
+  rng = random.Random()
+  while not stop.is_set():
+    path = rng.choice(PATHS).format(rng.choice(ids))
+    start = time.perf_counter()
+    try:
+      response = client.get(path)
+      # the whole body, streamed pages render while it is read
+      response.get_data()
+      status = response.status_code
+    except Exception:
+      status = None
+    latencies.append(time.perf_counter() - start)
+    if status != 200:
+      errors.append(path)
+
+
+def run(workers, ids):
+  # a fresh pool per run, so its counters cover this run only
+  db.engine.dispose()
+  stop = threading.Event()
+  latencies, errors, checked_out = [], [], []
+  threads = [threading.Thread(target=worker, args=(stop, latencies, errors, ids)) for _ in range(workers)]
+  start = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  while time.perf_counter() - start < SECONDS:
+    time.sleep(0.05)
+    checked_out.append(pool_status(db.engine).get('checked_out', 0))
+  stop.set()
+  for thread in threads:
+    thread.join()
+  seconds = time.perf_counter() - start
+
+  latencies.sort()
+  status = pool_status(db.engine)
+  print('{:>4} workers {:>8.0f} req/s  p50 {:>7.1f} ms  p99 {:>7.1f} ms  errors {:>4}  '
+    'checked out max {:>3}  overflow {:>3}  waits {:>6}  wait max {:>7} ms  timeouts {}'.format(
+    workers, len(latencies) / seconds,
+    latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000, len(errors),
+    max(checked_out or [0]), status.get('overflow', '-'), status.get('waits', '-'),
+    status.get('wait_ms_max', '-'), status.get('timeouts', '-')))
+
+
+def main():
+  counts = [int(count) for count in sys.argv[1:]] or [1, 2, 4, 8, 16]
+  # every request should reach the database
+  fyyur.page_cache.ttl = 0
+  reset_db()
+  seed(venues=2000, artists=2000, shows=20000, cities=200)
+  ids = list(range(1, 2001))
+  print('{} on {}, {}s per run'.format(pool_status(db.engine)['pool'], db.engine.dialect.name, SECONDS))
+  for workers in counts:
+    run(workers, ids)
+
+
+if __name__ == '__main__':
+  with app.app_context():
+    main()
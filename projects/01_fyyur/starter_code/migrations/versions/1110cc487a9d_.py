@@ -0,0 +1,45 @@
+"""upcoming shows feed
+
+Revision ID: 1110cc487a9d
+Revises: 6db7d9c30170
+Create Date: 2026-10-18 21:48:03.127604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1110cc487a9d'
+down_revision = '6db7d9c30170'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('show_feed',
+        sa.Column('show_id', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('venue_name', sa.String(), nullable=True),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('artist_name', sa.String(), nullable=True),
+        sa.Column('artist_image_link', sa.String(length=500), nullable=True),
+        sa.PrimaryKeyConstraint('show_id')
+    )
+    op.execute(
+        'INSERT INTO show_feed (show_id, start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link) '
+        'SELECT show.id, show.start_time, show.venue_id, venue.name, show.artist_id, artist.name, artist.image_link '
+        'FROM show JOIN venue ON venue.id = show.venue_id JOIN artist ON artist.id = show.artist_id '
+        'WHERE show.start_time >= LOCALTIMESTAMP')
+    # built after the rows are in
+    op.create_index('ix_show_feed_start_time_show_id', 'show_feed', ['start_time', 'show_id'], unique=False)
+    op.create_index('ix_show_feed_venue_id', 'show_feed', ['venue_id'], unique=False)
+    op.create_index('ix_show_feed_artist_id', 'show_feed', ['artist_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_show_feed_artist_id', table_name='show_feed')
+    op.drop_index('ix_show_feed_venue_id', table_name='show_feed')
+    op.drop_index('ix_show_feed_start_time_show_id', table_name='show_feed')
+    op.drop_table('show_feed')
@@ -0,0 +1,45 @@
+"""show access path indexes and NOT NULL columns
+
+Revision ID: 663eb973610c
+Revises: dc66348fbb77
+Create Date: 2026-10-18 11:02:17.904126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '663eb973610c'
+down_revision = 'dc66348fbb77'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # fails on existing NULLs, clean those rows up before upgrading
+    op.alter_column('show', 'start_time', existing_type=sa.DateTime(), nullable=False)
+    op.alter_column('show', 'artist_id', existing_type=sa.Integer(), nullable=False)
+    op.alter_column('show', 'venue_id', existing_type=sa.Integer(), nullable=False)
+    op.alter_column('artist', 'name', existing_type=sa.String(), nullable=False)
+    op.alter_column('venue', 'name', existing_type=sa.String(), nullable=False)
+
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'], unique=False)
+    op.create_index('ix_venue_city_state', 'venue', ['city', 'state'], unique=False)
+    op.create_index('ix_artist_name_id', 'artist', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artist_name_id', table_name='artist')
+    op.drop_index('ix_venue_city_state', table_name='venue')
+    op.drop_index('ix_show_start_time_id', table_name='show')
+    op.drop_index('ix_show_artist_id_start_time', table_name='show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='show')
+
+    op.alter_column('venue', 'name', existing_type=sa.String(), nullable=True)
+    op.alter_column('artist', 'name', existing_type=sa.String(), nullable=True)
+    op.alter_column('show', 'venue_id', existing_type=sa.Integer(), nullable=True)
+    op.alter_column('show', 'artist_id', existing_type=sa.Integer(), nullable=True)
+    op.alter_column('show', 'start_time', existing_type=sa.DateTime(), nullable=True)
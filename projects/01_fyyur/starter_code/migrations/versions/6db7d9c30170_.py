@@ -0,0 +1,48 @@
+"""venue and artist show counters
+
+Revision ID: 6db7d9c30170
+Revises: 663eb973610c
+Create Date: 2026-10-18 21:05:12.418730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6db7d9c30170'
+down_revision = '663eb973610c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_show_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_show_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('next_show_at', sa.DateTime(), nullable=True))
+    op.create_table('show_rollover',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('rolled_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # count the existing shows as of now, the first rollover
+    op.execute("INSERT INTO show_rollover (id, rolled_at) VALUES (1, LOCALTIMESTAMP)")
+    for table, key in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        op.execute(
+            'UPDATE {table} SET '
+            'upcoming_show_count = (SELECT count(*) FROM show WHERE show.{key} = {table}.id '
+            'AND show.start_time >= (SELECT rolled_at FROM show_rollover)), '
+            'past_show_count = (SELECT count(*) FROM show WHERE show.{key} = {table}.id '
+            'AND show.start_time < (SELECT rolled_at FROM show_rollover)), '
+            'next_show_at = (SELECT min(show.start_time) FROM show WHERE show.{key} = {table}.id '
+            'AND show.start_time >= (SELECT rolled_at FROM show_rollover))'.format(table=table, key=key))
+
+
+def downgrade():
+    op.drop_table('show_rollover')
+    for table in ('artist', 'venue'):
+        op.drop_column(table, 'next_show_at')
+        op.drop_column(table, 'past_show_count')
+        op.drop_column(table, 'upcoming_show_count')
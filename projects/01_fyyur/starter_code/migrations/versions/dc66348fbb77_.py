@@ -0,0 +1,33 @@
+"""search indexes on artist and venue
+
+Revision ID: dc66348fbb77
+Revises: ca9da11a6e16
+Create Date: 2026-10-18 10:12:41.530518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dc66348fbb77'
+down_revision = 'ca9da11a6e16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('artist', 'venue'):
+        for column in ('name', 'city'):
+            op.create_index('ix_{}_{}_trgm'.format(table, column), table, [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+        op.create_index('ix_{}_genres'.format(table), table, ['genres'], unique=False,
+                        postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('venue', 'artist'):
+        op.drop_index('ix_{}_genres'.format(table), table_name=table)
+        for column in ('city', 'name'):
+            op.drop_index('ix_{}_{}_trgm'.format(table, column), table_name=table)
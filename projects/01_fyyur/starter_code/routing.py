@@ -0,0 +1,185 @@
+'''
+Read replica routing for db.session.
+
+Views decorated with db.replicas.read_only send their queries to one of the
+databases in DATABASE_REPLICA_URLS, taking the healthy replicas in turn.
+Everything else stays on the primary: create, edit and delete handlers, the
+edit forms and CLI commands. Without replicas configured, everything reads
+from the primary as before.
+
+Whichever request comes first after REPLICA_CHECK_INTERVAL seconds pings
+every replica. A replica that fails the ping, or drops a connection in the
+middle of a query, is skipped until a later ping succeeds. When no replica
+is healthy, reads go to the primary.
+
+A client that has just written (any request other than GET, HEAD or OPTIONS
+to a view that is not read only, so not the search forms) reads from the
+primary for REPLICA_STICKY_SECONDS afterwards. That way it sees its own
+changes even while the replicas lag behind. The deadline travels in the
+session cookie, so every worker needs the same SECRET_KEY.
+
+Two SQLite files work as stand-ins for local testing, e.g. copies of the
+primary database:
+
+    SECRET_KEY=dev DATABASE_URL=sqlite:///fyyur.db \
+    DATABASE_REPLICA_URLS=sqlite:///replica1.db,sqlite:///replica2.db flask run
+'''
+import threading
+import time
+from functools import wraps
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm, text
+
+from fsnd_common.engine import pool_status
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class Replica(object):
+  def __init__(self, bind):
+    self.bind = bind
+    self.engine = None
+    self.healthy = True
+    self.reads = 0
+    # times it went from healthy to down
+    self.failures = 0
+
+
+class Replicas(object):
+  def __init__(self, db):
+    self.db = db
+    self.app = None
+    self.replicas = []
+    self.turn = 0
+    self.next_check = 0.0
+    self.lock = threading.Lock()
+    self.check_lock = threading.Lock()
+
+  def init_app(self, app):
+    app.config.setdefault('DATABASE_REPLICA_URLS', [])
+    app.config.setdefault('REPLICA_CHECK_INTERVAL', 5)
+    app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+    if app.config['DATABASE_REPLICA_URLS'] and not app.config.get('SECRET_KEY'):
+      # the deadline must read the same on every worker
+      raise RuntimeError('DATABASE_REPLICA_URLS needs a SECRET_KEY shared by every worker')
+    # replicas are plain Flask-SQLAlchemy binds without tables, so their
+    # engines get the same options as the primary
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for number, url in enumerate(app.config['DATABASE_REPLICA_URLS'], 1):
+      binds['replica{}'.format(number)] = url
+      self.replicas.append(Replica('replica{}'.format(number)))
+    app.config['SQLALCHEMY_BINDS'] = binds or None
+    self.app = app
+
+    @app.after_request
+    def stick_to_primary(response):
+      if self.replicas and request.method not in SAFE_METHODS and not g.get('read_only'):
+        session['primary_until'] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+      return response
+
+  def engine(self, replica):
+    if replica.engine is None:
+      engine = self.db.get_engine(self.app, bind=replica.bind)
+      event.listen(engine, 'handle_error', lambda context: self.failed(replica, context))
+      replica.engine = engine
+    return replica.engine
+
+  def failed(self, replica, context):
+    # a lost or refused connection, not an error in the statement
+    if context.is_disconnect or context.connection is None:
+      self.mark_down(replica)
+
+  def mark_down(self, replica):
+    with self.lock:
+      if replica.healthy:
+        replica.healthy = False
+        replica.failures += 1
+
+  def check(self):
+    '''
+    Pings every replica, unless another thread is already at it.
+    '''
+    if not self.check_lock.acquire(blocking=False):
+      return
+    try:
+      self.next_check = time.monotonic() + self.app.config['REPLICA_CHECK_INTERVAL']
+      for replica in self.replicas:
+        try:
+          with self.engine(replica).connect() as connection:
+            connection.execute(text('SELECT 1'))
+          replica.healthy = True
+        except Exception:
+          self.mark_down(replica)
+    finally:
+      self.check_lock.release()
+
+  def choose(self):
+    if time.monotonic() >= self.next_check:
+      self.check()
+    with self.lock:
+      healthy = [replica for replica in self.replicas if replica.healthy]
+      if not healthy:
+        return None
+      replica = healthy[self.turn % len(healthy)]
+      self.turn += 1
+      replica.reads += 1
+    return replica
+
+  def sticky(self):
+    return session.get('primary_until', 0) > time.time()
+
+  def read_engine(self):
+    '''
+    The replica engine the current request reads from, None for the primary.
+    A request keeps the replica it started on.
+    '''
+    if not self.replicas or not has_request_context() or not g.get('read_only') or g.get('read_your_writes'):
+      return None
+    if 'read_replica' not in g:
+      replica = self.choose()
+      g.read_replica = self.engine(replica) if replica is not None else None
+    return g.read_replica
+
+  def read_only(self, f):
+    '''
+    Marks a view as read only. Put it above @page_cache.cached, so a client
+    reading its own writes skips pages rendered from a replica too.
+    '''
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+      g.read_only = True
+      g.read_your_writes = bool(self.replicas) and self.sticky()
+      return f(*args, **kwargs)
+    return wrapper
+
+  def status(self):
+    return [dict(pool_status(replica.engine) if replica.engine is not None else {},
+      bind=replica.bind, healthy=replica.healthy, reads=replica.reads, failures=replica.failures)
+      for replica in self.replicas]
+
+
+class RoutingSession(SignallingSession):
+  def get_bind(self, mapper=None, clause=None):
+    # flushes and DML always go to the primary
+    if not self._flushing and not getattr(clause, 'is_dml', False):
+      engine = get_state(self.app).db.replicas.read_engine()
+      if engine is not None:
+        return engine
+    return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+  '''
+  SQLAlchemy whose session reads through db.replicas.
+  '''
+  def __init__(self, app=None, **kwargs):
+    self.replicas = Replicas(self)
+    super(RoutingSQLAlchemy, self).__init__(app, **kwargs)
+
+  def init_app(self, app):
+    self.replicas.init_app(app)
+    super(RoutingSQLAlchemy, self).init_app(app)
+
+  def create_session(self, options):
+    return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,84 @@
+'''
+Template compilation and streaming.
+
+init_app(app) gives app.jinja_env a bytecode cache on disk, in
+JINJA_CACHE_DIR or a per-user directory under the system temp dir. A
+template compiled once, by any worker or by `flask compile-templates` at
+deploy time, is then loaded from there by every later process and restart
+instead of being parsed and compiled again. Entries are keyed by a checksum
+of the template source, so an edited template is never served from a stale
+entry.
+
+With TEMPLATES_AUTO_RELOAD off (production), a loaded template is never
+checked against its file again; restart the workers after a deploy.
+
+stream_template() renders a template as an iterable of chunks, for pages
+built from long loops, so the first bytes go out before the whole page is
+rendered: return Response(stream_template(...)).
+'''
+import os
+import tempfile
+from flask import current_app, stream_with_context
+from jinja2 import FileSystemBytecodeCache
+
+# template output chunks sent together when streaming
+STREAM_BUFFER = 64
+
+
+class AtomicBytecodeCache(FileSystemBytecodeCache):
+  '''
+  Writes each entry to a temporary file renamed into place, so workers
+  compiling the same template at once never read a half written entry.
+  '''
+  def dump_bytecode(self, bucket):
+    name = self._get_cache_filename(bucket)
+    f = tempfile.NamedTemporaryFile(mode='wb', dir=os.path.dirname(name), prefix=os.path.basename(name),
+                                    suffix='.tmp', delete=False)
+    try:
+      with f:
+        bucket.write_bytecode(f)
+      os.replace(f.name, name)
+    except BaseException:
+      os.remove(f.name)
+      raise
+
+
+def init_app(app):
+  app.config.setdefault('JINJA_BYTECODE_CACHE', True)
+  app.config.setdefault('JINJA_CACHE_DIR', None)
+  if app.config['JINJA_BYTECODE_CACHE']:
+    directory = app.config['JINJA_CACHE_DIR']
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = AtomicBytecodeCache(directory)
+  app.jinja_env.auto_reload = app.templates_auto_reload
+
+
+def compile_templates(app):
+  '''
+  Loads every .html template of the app, compiling the ones the bytecode
+  cache does not hold yet. Returns the template names.
+  '''
+  names = app.jinja_env.list_templates(extensions=['html'])
+  for name in names:
+    app.jinja_env.get_template(name)
+  return names
+
+
+def template_stream(template_name, **context):
+  '''
+  The rendered template as an iterable of chunks of STREAM_BUFFER outputs.
+  '''
+  app = current_app._get_current_object()
+  template = app.jinja_env.get_template(template_name)
+  app.update_template_context(context)
+  stream = template.stream(context)
+  stream.enable_buffering(STREAM_BUFFER)
+  return stream
+
+
+def stream_template(template_name, **context):
+  '''
+  template_stream() keeping the request context until the last chunk.
+  '''
+  return stream_with_context(template_stream(template_name, **context))
@@ -0,0 +1,101 @@
+import os
+import re
+import sqlite3
+import tempfile
+import unittest
+from flask import Flask
+
+# a primary and two replicas, SQLite files standing in for the databases
+directory = tempfile.mkdtemp()
+path = lambda name: os.path.join(directory, name + '.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + path('primary')
+os.environ['DATABASE_REPLICA_URLS'] = 'sqlite:///{},sqlite:///{}'.format(path('replica1'), path('replica2'))
+os.environ['SECRET_KEY'] = 'test'
+
+from app import app, db, page_cache, replicas, Venue
+from routing import RoutingSQLAlchemy
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    """Read-only views read from the replicas, writers stick to the primary"""
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['WTF_CSRF_ENABLED'] = False
+        page_cache.ttl = 0
+        with app.app_context():
+            db.create_all()
+            db.session.add(Venue(name='Primary', city='San Francisco', state='CA', genres=['Jazz']))
+            db.session.commit()
+            db.engine.dispose()
+        # each replica is a copy of the primary, told apart by the venue name
+        primary = sqlite3.connect(path('primary'))
+        for number in (1, 2):
+            replica = sqlite3.connect(path('replica{}'.format(number)))
+            primary.backup(replica)
+            replica.execute("UPDATE venue SET name = 'Replica{}'".format(number))
+            replica.commit()
+            replica.close()
+        primary.close()
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def read_venue(self):
+        res = self.client.get('/venues/1')
+        self.assertEqual(res.status_code, 200)
+        return re.search(r'Primary|Replica\d', res.get_data(as_text=True)).group()
+
+    def test_reads_take_the_replicas_in_turn(self):
+        reads = [self.read_venue() for _ in range(4)]
+
+        self.assertEqual(sorted(reads), ['Replica1', 'Replica1', 'Replica2', 'Replica2'])
+        self.assertNotEqual(reads[0], reads[1])
+
+    def test_writer_reads_from_the_primary(self):
+        res = self.client.post('/venues/create', data={
+            'name': 'New Venue', 'city': 'San Francisco', 'state': 'CA', 'address': '1 Main St',
+            'phone': '123-456-7890', 'genres': 'Jazz', 'facebook_link': '',
+        })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.read_venue(), 'Primary')
+        self.assertEqual(app.test_client().get('/venues/1').status_code, 200)
+
+    def test_search_does_not_stick_to_the_primary(self):
+        res = self.client.post('/venues/search', data={'search_term': 'Replica'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Replica', res.get_data(as_text=True))
+        self.assertEqual({self.read_venue() for _ in range(2)}, {'Replica1', 'Replica2'})
+
+    def test_status_counts_replica_reads(self):
+        self.read_venue()
+
+        self.assertTrue(all(replica['healthy'] for replica in replicas.status()))
+        self.assertTrue(sum(replica['reads'] for replica in replicas.status()))
+
+    def test_replicas_need_a_shared_secret_key(self):
+        worker = Flask(__name__)
+        worker.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI']
+        worker.config['DATABASE_REPLICA_URLS'] = app.config['DATABASE_REPLICA_URLS']
+
+        with self.assertRaises(RuntimeError):
+            RoutingSQLAlchemy(worker)
+
+    def test_another_worker_reads_the_deadline(self):
+        res = self.client.post('/venues/create', data={
+            'name': 'Other Venue', 'city': 'San Francisco', 'state': 'CA', 'address': '1 Main St',
+            'phone': '123-456-7890', 'genres': 'Jazz', 'facebook_link': '',
+        })
+        cookie = res.headers['Set-Cookie'].split(';')[0].split('=', 1)[1]
+        worker = Flask(__name__)
+        worker.secret_key = os.environ['SECRET_KEY']
+
+        session = worker.session_interface.get_signing_serializer(worker).loads(cookie)
+        self.assertIn('primary_until', session)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+'''
+Benchmarks for the trivia backend.
+
+    python bench.py quiz
+    BENCH_DATABASE_URL=postgresql://localhost:5432/trivia_bench python bench.py search
+    BENCH_DATABASE_URL=postgresql://localhost:5432/trivia_bench python bench.py writes
+
+The search and writes benchmarks drop and recreate the questions table of
+BENCH_DATABASE_URL, never point them at a database you care about.
+'''
+import os
+import random
+import sys
+import time
+from flask import Flask
+
+from models import db, setup_db, invalidate, unit_of_work, Question
+from quiz import QuizIndex, QuizSession
+from search import create_search_index, search_questions
+
+BENCH_DATABASE_URL = os.environ.get('BENCH_DATABASE_URL', 'postgresql://localhost:5432/trivia_bench')
+
+
+def report(name, seconds, operations):
+  print('{:<44} {:>10.1f} ms {:>10.2f} us/op'.format(name, seconds * 1000, seconds * 1e6 / operations))
+
+
+def naive_draw(ids, previous, rng):
+  # load the category and retry random.choice until an unused question comes up
+  previous = set(previous)
+  if len(previous.intersection(ids)) >= len(ids):
+    return None
+  while True:
+    id = rng.choice(ids)
+    if id not in previous:
+      return id
+
+
+def play(draw, quizzes, questions_per_quiz):
+  '''
+  Plays quizzes of questions_per_quiz draws each, returns the seconds taken
+  and the number of draws.
+  '''
+  draws = 0
+  start = time.perf_counter()
+  for _ in range(quizzes):
+    previous = []
+    for _ in range(questions_per_quiz):
+      id = draw(previous)
+      if id is None:
+        break
+      previous.append(id)
+      draws += 1
+  return time.perf_counter() - start, draws
+
+
+def bench_quiz():
+  rng = random.Random(0)
+  # integer categories, as in trivia.psql
+  rows = [(id, id % 6 + 1) for id in range(1, 100001)]
+  index = QuizIndex(rows)
+  category = [id for id, category in rows if category == 1]
+  small = QuizIndex(rows[:6000])
+  small_category = [id for id, category in rows[:6000] if category == 1]
+
+  # the frontend plays five questions a quiz
+  report('100k questions, 10k quizzes x5: naive', *play(lambda previous: naive_draw(category, previous, rng), 10000, 5))
+  report('100k questions, 10k quizzes x5: index', *play(lambda previous: index.draw('1', previous, rng), 10000, 5))
+  # late in a quiz almost every question has been used: one quiz through a
+  # whole category of 1k questions (of 6k)
+  report('1 quiz through a 1k category: naive', *play(lambda previous: naive_draw(small_category, previous, rng), 1, 1000))
+  report('1 quiz through a 1k category: index', *play(lambda previous: small.draw('1', previous, rng), 1, 1000))
+  # a session walks the category and keeps nothing but a position
+  session = QuizSession('1')
+  report('1 quiz through a 1k category: session', *play(lambda previous: session.draw(small, rng), 1, 1000))
+  session = QuizSession(None)
+  report('1 quiz through all 100k questions: session', *play(lambda previous: session.draw(index, rng), 1, 100000))
+
+
+def fixture_questions(path=os.path.join(os.path.dirname(__file__), 'trivia.psql')):
+  '''
+  The rows of the questions COPY block of trivia.psql, as dicts.
+  '''
+  rows = []
+  with open(path) as f:
+    lines = iter(f)
+    for line in lines:
+      if line.startswith('COPY public.questions '):
+        columns = line[line.index('(') + 1:line.index(')')].split(', ')
+        break
+    for line in lines:
+      if line.startswith('\\.'):
+        break
+      rows.append(dict(zip(columns, line.rstrip('\n').split('\t'))))
+  return rows
+
+
+def load_questions(copies):
+  db.drop_all()
+  db.session.execute('DROP TABLE IF EXISTS questions_fts')
+  db.session.commit()
+  db.create_all()
+  invalidate('search_fts')
+
+  fixture = fixture_questions()
+  rows = [
+    dict(row, id=copy * len(fixture) + i + 1, difficulty=int(row['difficulty']))
+    for copy in range(copies) for i, row in enumerate(fixture)
+  ]
+  for start in range(0, len(rows), 5000):
+    db.session.execute(Question.__table__.insert(), rows[start:start + 5000])
+  db.session.commit()
+  return len(rows)
+
+
+def time_searches(search, terms, repeat):
+  start = time.perf_counter()
+  for _ in range(repeat):
+    for term in terms:
+      search(term)
+  return time.perf_counter() - start, repeat * len(terms)
+
+
+def scan(term):
+  # what the endpoint would do without the indexes
+  query = Question.query.filter(Question.question.ilike('%' + term + '%'))
+  return query.count(), query.order_by(Question.id).limit(10).all()
+
+
+def bench_app():
+  app = Flask(__name__)
+  # loading and indexing run long statements
+  app.config['DATABASE_POOL_PROFILE'] = 'worker'
+  setup_db(app, BENCH_DATABASE_URL)
+  return app
+
+
+def bench_search():
+  with bench_app().app_context():
+    # trivia.psql scaled up 1000x
+    count = load_questions(1000)
+    terms = ['title', 'soccer', 'Van Gogh', 'MIRRORS', 'no such question']
+    print('{} questions on {}'.format(count, db.engine.dialect.name))
+    report('search x{}: ilike scan'.format(len(terms) * 20), *time_searches(scan, terms, 20))
+
+    start = time.perf_counter()
+    create_search_index()
+    print('create_search_index {:>33.1f} ms'.format((time.perf_counter() - start) * 1000))
+    if db.engine.dialect.name == 'postgresql':
+      db.session.execute('ANALYZE questions')
+      db.session.commit()
+    report('search x{}: indexed'.format(len(terms) * 20), *time_searches(search_questions, terms, 20))
+    report('search x{}: indexed, page 50'.format(len(terms) * 20),
+      *time_searches(lambda term: search_questions(term, page=50), terms, 20))
+
+
+def bench_writes(count=100000):
+  fixture = fixture_questions()
+  rows = [
+    {'question': row['question'], 'answer': row['answer'], 'category': row['category'], 'difficulty': int(row['difficulty'])}
+    for row in (fixture[i % len(fixture)] for i in range(count))
+  ]
+
+  def one_by_one():
+    for row in rows:
+      Question(**row).insert()
+
+  def batched():
+    with unit_of_work(commit_every=1000):
+      for row in rows:
+        Question(**row).insert()
+
+  with bench_app().app_context():
+    print('{} questions on {}'.format(count, db.engine.dialect.name))
+    for name, write in [
+      ('insert(), commit per row', one_by_one),
+      ('insert() in unit_of_work(1000)', batched),
+      ('bulk_insert()', lambda: Question.bulk_insert(rows)),
+    ]:
+      load_questions(0)
+      start = time.perf_counter()
+      write()
+      seconds = time.perf_counter() - start
+      assert db.session.query(db.func.count(Question.id)).scalar() == count
+      report('write {}k: {}'.format(count // 1000, name), seconds, count)
+
+
+BENCHMARKS = {
+  'quiz': bench_quiz,
+  'search': bench_search,
+  'writes': bench_writes,
+}
+
+if __name__ == '__main__':
+  for name in sys.argv[1:] or sorted(BENCHMARKS):
+    BENCHMARKS[name]()
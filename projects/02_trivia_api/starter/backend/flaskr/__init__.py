@@ -1,17 +1,35 @@
 import os
+import click
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+from models import setup_db, Question, Category, question_count, category_map, invalidate
+from fsnd_common import instrumentation
+from fsnd_common.conditional import versions
+from quiz import quiz_index, store_from_config, start_session, session_draw
+from search import create_search_index, search_questions
 
 QUESTIONS_PER_PAGE = 10
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  app.config.from_mapping(test_config or {})
   setup_db(app)
+  instrumentation.init_app(app)
+  # QUIZ_SEED makes the quiz draws repeatable in tests
+  quiz_random = random.Random(app.config.get('QUIZ_SEED'))
+  quiz_sessions = store_from_config(app.config)
+
+  @app.cli.command('create-search-index')
+  def create_search_index_command():
+    '''Adds the question search indexes, see search.py.'''
+    if create_search_index():
+      click.echo('search runs on the index')
+    else:
+      click.echo('no index, search scans the table')
   
   '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -22,24 +40,55 @@ def create_app(test_config=None):
   '''
 
   '''
-  @TODO: 
-  Create an endpoint to handle GET requests 
-  for all available categories.
-  '''
-
-
-  '''
-  @TODO: 
-  Create an endpoint to handle GET requests for questions, 
-  including pagination (every 10 questions). 
-  This endpoint should return a list of questions, 
-  number of total questions, current category, categories. 
-
-  TEST: At this point, when you start the application
-  you should see questions and categories generated,
-  ten questions per page and pagination at the bottom of the screen for three pages.
-  Clicking on the page numbers should update the questions. 
-  '''
+  GET /categories
+    the category id -> type map, served from the process wide cache.
+    Conditional on the categories version, If-None-Match gets a 304
+  '''
+  @app.route('/categories')
+  @versions.conditional('categories')
+  def get_categories():
+    return jsonify({
+      'success': True,
+      'categories': category_map()
+    })
+
+  '''
+  GET /questions?page=<n>
+  GET /questions?after=<id>
+    QUESTIONS_PER_PAGE questions in id order with the total count and the
+    categories. Both forms are a LIMIT query on the primary key; page=<n>
+    skips (n - 1) pages with OFFSET for the frontend's page links, after=<id>
+    seeks past the given id and stays constant time however deep it goes.
+    next_cursor is the after value of the next page, null on the last one.
+    Conditional on the questions and categories versions.
+  '''
+  @app.route('/questions')
+  @versions.conditional('questions', 'categories')
+  def get_questions():
+    page = request.args.get('page', 1, type=int)
+    after = request.args.get('after', type=int)
+    if page < 1:
+      abort(400)
+
+    query = Question.query.order_by(Question.id)
+    if after is not None:
+      query = query.filter(Question.id > after)
+    else:
+      query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+    questions = query.limit(QUESTIONS_PER_PAGE + 1).all()
+    more = len(questions) > QUESTIONS_PER_PAGE
+    questions = questions[:QUESTIONS_PER_PAGE]
+    if not questions and (page > 1 or after is not None):
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in questions],
+      'total_questions': question_count(),
+      'categories': category_map(),
+      'current_category': None,
+      'next_cursor': questions[-1].id if more else None
+    })
 
   '''
   @TODO: 
@@ -61,15 +110,30 @@ def create_app(test_config=None):
   '''
 
   '''
-  @TODO: 
-  Create a POST endpoint to get questions based on a search term. 
-  It should return any questions for whom the search term 
-  is a substring of the question. 
-
-  TEST: Search by any phrase. The questions list will update to include 
-  only question that include that string within their question. 
-  Try using the word "title" to start. 
+  POST /questions/search
+    {"searchTerm": <term>, "page": <page, 1 by default>}
+    the questions whose text or answer contains the term, case-insensitive,
+    QUESTIONS_PER_PAGE at a time and best matches first. total_questions
+    counts every match. See search.py for the indexes behind it.
   '''
+  @app.route('/questions/search', methods=['POST'])
+  def search():
+    body = request.get_json(silent=True) or {}
+    term = body.get('searchTerm')
+    page = body.get('page', 1)
+    if not isinstance(term, str) or not isinstance(page, int) or page < 1:
+      abort(400)
+
+    total, questions = search_questions(term.strip(), page, QUESTIONS_PER_PAGE)
+    if not questions and page > 1:
+      abort(404)
+
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in questions],
+      'total_questions': total,
+      'current_category': None
+    })
 
   '''
   @TODO: 
@@ -82,16 +146,61 @@ def create_app(test_config=None):
 
 
   '''
-  @TODO: 
-  Create a POST endpoint to get questions to play the quiz. 
-  This endpoint should take category and previous question parameters 
-  and return a random questions within the given category, 
-  if provided, and that is not one of the previous questions. 
-
-  TEST: In the "Play" tab, after a user selects "All" or a category,
-  one question at a time is displayed, the user is allowed to answer
-  and shown whether they were correct or not. 
-  '''
+  POST /quizzes
+    {"previous_questions": [ids], "quiz_category": {"id": <id, 0 for all>}}
+    a random question of the category that is not in previous_questions, or
+    null once the category is used up. The draw comes from the in-memory
+    quiz index and costs one primary key lookup.
+
+    {"quiz_session": token} draws from a session started with
+    POST /quizzes/sessions instead; the server remembers the questions
+    used, so the client no longer resends them. 404 once the session expired.
+  '''
+  def category_id(body):
+    try:
+      category = int((body.get('quiz_category') or {}).get('id', 0))
+    except (TypeError, ValueError):
+      abort(400)
+    return str(category) if category else None
+
+  @app.route('/quizzes/sessions', methods=['POST'])
+  def create_quiz_session():
+    body = request.get_json(silent=True) or {}
+    return jsonify({
+      'success': True,
+      'quiz_session': start_session(quiz_sessions, category_id(body))
+    })
+
+  @app.route('/quizzes', methods=['POST'])
+  def play_quiz():
+    body = request.get_json(silent=True) or {}
+    token = body.get('quiz_session')
+    if token is not None:
+      if not isinstance(token, str):
+        abort(400)
+      draw = lambda: session_draw(quiz_sessions, token, quiz_random)
+    else:
+      previous = body.get('previous_questions', [])
+      if not isinstance(previous, list) or not all(isinstance(id, int) for id in previous):
+        abort(400)
+      category = category_id(body)
+      draw = lambda: (True, quiz_index().draw(category, previous, quiz_random))
+
+    question = None
+    for attempt in range(2):
+      found, id = draw()
+      if not found:
+        abort(404)
+      question = Question.query.get(id) if id is not None else None
+      if question is not None or id is None:
+        break
+      # deleted by another process since the index was built
+      invalidate('quiz_index')
+
+    return jsonify({
+      'success': True,
+      'question': question.format() if question else None
+    })
 
   '''
   @TODO: 
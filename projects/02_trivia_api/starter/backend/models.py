@@ -1,8 +1,14 @@
 import os
+import time
+from contextlib import contextmanager
+from itertools import islice
 from sqlalchemy import Column, String, Integer, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_common.engine import configure_engine
+from fsnd_common.conditional import versions
+
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
@@ -11,14 +17,110 @@ db = SQLAlchemy()
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    pool and connection settings come from engine.configure_engine()
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    configure_engine(app)
     db.app = app
     db.init_app(app)
     db.create_all()
 
+'''
+cached(key, load)
+    process wide cache for values read on every request, such as the question
+    count and the category map. The write helpers below drop the keys they
+    change; entries also expire after CACHE_TTL seconds so writes made by
+    other processes show up eventually.
+'''
+CACHE_TTL = 60
+_cache = {}
+
+def cached(key, load):
+  entry = _cache.get(key)
+  if entry is None or entry[1] < time.monotonic():
+    entry = _cache[key] = (load(), time.monotonic() + CACHE_TTL)
+  return entry[0]
+
+def invalidate(*keys):
+  for key in keys:
+    _cache.pop(key, None)
+
+def question_count():
+  return cached('question_count', lambda: db.session.query(db.func.count(Question.id)).scalar())
+
+def category_map():
+  return cached('category_map', lambda: {
+    str(id): type for id, type in db.session.query(Category.id, Category.type).order_by(Category.id)
+  })
+
+'''
+unit_of_work(commit_every=None)
+    batches the write helpers called in the block: insert(), update() and
+    delete() no longer commit one by one, the block commits once at the end,
+    or every commit_every writes, and rolls back if it raises. The caches
+    and versions the writes touched are dropped once, when it ends.
+    A unit_of_work inside another joins it.
+    EXAMPLE
+        with unit_of_work():
+            for row in rows:
+                Question(**row).insert()
+'''
+class UnitOfWork(object):
+  def __init__(self, commit_every=None):
+    self.commit_every = commit_every
+    self.writes = 0
+    self.keys = set()
+    self.resources = set()
+
+@contextmanager
+def unit_of_work(commit_every=None):
+  work = db.session.info.get('unit_of_work')
+  if work is not None:
+    yield work
+    return
+
+  work = db.session.info['unit_of_work'] = UnitOfWork(commit_every)
+  try:
+    yield work
+    db.session.commit()
+  except BaseException:
+    db.session.rollback()
+    raise
+  finally:
+    del db.session.info['unit_of_work']
+    # batches committed before a failure are in the database too
+    invalidate(*work.keys)
+    versions.bump(*work.resources)
+
+'''
+commit(keys, resources)
+    ends a write helper: commits and drops the cache keys and versions it
+    changed, or leaves both to the enclosing unit_of_work
+'''
+def commit(keys, resources):
+  work = db.session.info.get('unit_of_work')
+  if work is None:
+    db.session.commit()
+    invalidate(*keys)
+    versions.bump(*resources)
+    return
+
+  work.keys.update(keys)
+  work.resources.update(resources)
+  work.writes += 1
+  if work.commit_every and work.writes % work.commit_every == 0:
+    db.session.commit()
+
+def batches(rows, size):
+  rows = iter(rows)
+  while True:
+    batch = list(islice(rows, size))
+    if not batch:
+      return
+    yield batch
+
 '''
 Question
 
@@ -40,14 +142,42 @@ class Question(db.Model):
 
   def insert(self):
     db.session.add(self)
-    db.session.commit()
+    commit(('question_count', 'quiz_index'), ('questions',))
   
   def update(self):
-    db.session.commit()
+    commit(('quiz_index',), ('questions',))
 
   def delete(self):
     db.session.delete(self)
-    db.session.commit()
+    commit(('question_count', 'quiz_index'), ('questions',))
+
+  '''
+  bulk_insert(rows, batch_size=1000)
+      inserts rows, dicts of column values or Question objects, with one
+      executemany per batch_size rows and a single commit, or within the
+      enclosing unit_of_work. Returns the number of rows inserted.
+      EXAMPLE
+          Question.bulk_insert({'question': q, 'answer': a, 'category': '1', 'difficulty': 2} for q, a in pairs)
+  '''
+  @classmethod
+  def bulk_insert(cls, rows, batch_size=1000):
+    count = 0
+    with unit_of_work():
+      for batch in batches(rows, batch_size):
+        db.session.execute(cls.__table__.insert(), [
+          row.values() if isinstance(row, Question) else row for row in batch
+        ])
+        count += len(batch)
+        commit(('question_count', 'quiz_index'), ('questions',))
+    return count
+
+  def values(self):
+    return {
+      'question': self.question,
+      'answer': self.answer,
+      'category': self.category,
+      'difficulty': self.difficulty
+    }
 
   def format(self):
     return {
@@ -71,6 +201,17 @@ class Category(db.Model):
   def __init__(self, type):
     self.type = type
 
+  def insert(self):
+    db.session.add(self)
+    commit(('category_map',), ('categories',))
+
+  def update(self):
+    commit(('category_map',), ('categories',))
+
+  def delete(self):
+    db.session.delete(self)
+    commit(('category_map',), ('categories',))
+
   def format(self):
     return {
       'id': self.id,
@@ -0,0 +1,221 @@
+import math
+import random
+import secrets
+import threading
+import time
+
+from models import db, Question, cached
+
+'''
+QuizIndex
+    the question ids of every category (and of all categories, under None),
+    as a list to draw from and a set for membership. Categories are keyed
+    as strings: the column is an integer in trivia.psql and a string in
+    models.py, and requests name them either way.
+
+    draw() picks uniformly among the ids not in previous. While at most half
+    of the category has been used it retries random picks, which takes fewer
+    than two tries on average; past that it picks from the set difference of
+    the category and previous. Both are O(k) for the k previous questions
+    the request carries (the difference walks at most 2k ids, in C), which
+    is as cheap as a stateless draw gets: late in a long quiz reading
+    previous itself is the cost. Quiz sessions below draw in O(1).
+'''
+class QuizIndex(object):
+  def __init__(self, rows):
+    self.ids = {None: []}
+    for id, category in sorted(rows):
+      self.ids[None].append(id)
+      self.ids.setdefault(str(category), []).append(id)
+    self.members = {category: set(ids) for category, ids in self.ids.items()}
+
+  @classmethod
+  def load(cls):
+    return cls(db.session.query(Question.id, Question.category).all())
+
+  def draw(self, category, previous, rng=random):
+    ids = self.ids.get(category, [])
+    members = self.members.get(category, set())
+    excluded = {id for id in previous if id in members}
+    if len(excluded) >= len(ids):
+      return None
+
+    if len(excluded) <= len(ids) // 2:
+      while True:
+        id = ids[rng.randrange(len(ids))]
+        if id not in excluded:
+          return id
+    return rng.choice(tuple(members.difference(excluded)))
+
+
+'''
+QuestionSet
+    the questions used in a quiz session, one bit per question id, so a
+    session costs id / 8 bytes however many questions it has played.
+'''
+class QuestionSet(object):
+  def __init__(self, data=b'', count=0):
+    self.bits = bytearray(data)
+    self.count = count
+
+  def __contains__(self, id):
+    byte = id >> 3
+    return byte < len(self.bits) and bool(self.bits[byte] & (1 << (id & 7)))
+
+  def __len__(self):
+    return self.count
+
+  def add(self, id):
+    if id in self:
+      return
+    byte = id >> 3
+    if byte >= len(self.bits):
+      self.bits.extend(bytes(byte - len(self.bits) + 1))
+    self.bits[byte] |= 1 << (id & 7)
+    self.count += 1
+
+
+'''
+QuizSession
+    a quiz played against the server: the category, the questions used and
+    a walk over the category's ids in the quiz index, position i visiting
+    ids[(offset + i * stride) % size] with a random offset and a random
+    stride coprime with size, so every id comes up once in a shuffled
+    order and a draw is O(1). When the category changed size since the walk
+    began (questions added or deleted), a new walk starts over the current
+    ids and skips the ones already used.
+    Stored as bytes, 'category|count|size|offset|stride|position|' followed
+    by the bitset of used questions.
+'''
+class QuizSession(object):
+  def __init__(self, category, used=None, size=-1, offset=0, stride=1, position=0):
+    self.category = category
+    self.used = used or QuestionSet()
+    self.size = size
+    self.offset = offset
+    self.stride = stride
+    self.position = position
+
+  def walk(self, size, rng=random):
+    self.size = size
+    self.offset = rng.randrange(size) if size else 0
+    self.stride = 1
+    if size > 2:
+      self.stride = rng.randrange(1, size)
+      while math.gcd(self.stride, size) != 1:
+        self.stride = rng.randrange(1, size)
+    self.position = 0
+
+  def draw(self, index, rng=random):
+    '''
+    The next unused question id of the category, marked used, or None once
+    the category is used up.
+    '''
+    ids = index.ids.get(self.category, [])
+    if len(ids) != self.size:
+      self.walk(len(ids), rng)
+    while self.position < self.size:
+      id = ids[(self.offset + self.position * self.stride) % self.size]
+      self.position += 1
+      if id not in self.used:
+        self.used.add(id)
+        return id
+    return None
+
+  def dumps(self):
+    return '{}|{}|{}|{}|{}|{}|'.format(
+      self.category or '', self.used.count, self.size, self.offset, self.stride, self.position
+    ).encode() + bytes(self.used.bits)
+
+  @classmethod
+  def loads(cls, data):
+    category, count, size, offset, stride, position, bits = data.split(b'|', 6)
+    return cls(category.decode() or None, QuestionSet(bits, int(count)),
+               int(size), int(offset), int(stride), int(position))
+
+
+'''
+MemorySessionStore
+    quiz sessions of this process, dropped ttl seconds after their last write.
+RedisSessionStore
+    quiz sessions shared by every process, over a redis-py compatible client
+    (anything with get and set(ex=)).
+'''
+class MemorySessionStore(object):
+  def __init__(self, ttl=3600):
+    self.ttl = ttl
+    self.sessions = {}
+    self.lock = threading.Lock()
+
+  def get(self, token):
+    with self.lock:
+      entry = self.sessions.get(token)
+      if entry is None or entry[1] < time.monotonic():
+        self.sessions.pop(token, None)
+        return None
+      return entry[0]
+
+  def set(self, token, data):
+    now = time.monotonic()
+    with self.lock:
+      self.sessions[token] = (data, now + self.ttl)
+      if len(self.sessions) % 1024 == 0:
+        for token in [token for token, entry in self.sessions.items() if entry[1] < now]:
+          del self.sessions[token]
+
+
+class RedisSessionStore(object):
+  def __init__(self, client, ttl=3600, prefix='trivia:quiz:'):
+    self.client = client
+    self.ttl = ttl
+    self.prefix = prefix
+
+  def get(self, token):
+    return self.client.get(self.prefix + token)
+
+  def set(self, token, data):
+    self.client.set(self.prefix + token, data, ex=self.ttl)
+
+
+def store_from_config(config):
+  '''
+  QUIZ_SESSION_STORE when the app was given one, a RedisSessionStore when
+  QUIZ_SESSION_REDIS_URL is set (needs the redis package), otherwise a
+  MemorySessionStore. Sessions live QUIZ_SESSION_TTL seconds.
+  '''
+  if config.get('QUIZ_SESSION_STORE') is not None:
+    return config['QUIZ_SESSION_STORE']
+  ttl = config.get('QUIZ_SESSION_TTL', 3600)
+  if config.get('QUIZ_SESSION_REDIS_URL'):
+    import redis
+    return RedisSessionStore(redis.Redis.from_url(config['QUIZ_SESSION_REDIS_URL']), ttl)
+  return MemorySessionStore(ttl)
+
+
+def start_session(store, category):
+  token = secrets.token_urlsafe(16)
+  store.set(token, QuizSession(category).dumps())
+  return token
+
+
+def session_draw(store, token, rng=random):
+  '''
+  Draws the next question id of the session and marks it used. Returns
+  (found, id): found is False for an unknown or expired token, or one
+  stored in an older format, id is None once the category is used up.
+  '''
+  data = store.get(token)
+  if data is None:
+    return False, None
+  try:
+    session = QuizSession.loads(data)
+  except ValueError:
+    return False, None
+  id = session.draw(quiz_index(), rng)
+  if id is not None:
+    store.set(token, session.dumps())
+  return True, id
+
+
+def quiz_index():
+  return cached('quiz_index', QuizIndex.load)
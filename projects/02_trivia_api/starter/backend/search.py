@@ -0,0 +1,113 @@
+'''
+Case-insensitive substring search over question text and answers.
+
+create_search_index() is the migration: trivia.psql ships no indexes besides
+the primary keys, so run it once per database, and again any time, it is
+idempotent:
+    flask create-search-index
+Until then search scans the table, as it does where the index cannot be
+created (no privilege to create the extension, SQLite without FTS5).
+    Postgres  pg_trgm GIN indexes on questions.question and questions.answer,
+              which serve ILIKE '%term%' without reading the whole table.
+              Built CONCURRENTLY, so questions stay writable meanwhile; a
+              build that fails leaves an invalid index to drop before
+              running it again.
+    SQLite    an FTS5 table with the trigram tokenizer, kept in step with
+              questions by triggers, for local runs and tests.
+
+search_questions() ranks questions matching in their text before those
+matching only in their answer, then by closeness to the term.
+'''
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from models import db, Question, cached, invalidate
+
+POSTGRES_INDEX = [
+  'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+  'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_question_trgm ON questions USING gin (question gin_trgm_ops)',
+  'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_answer_trgm ON questions USING gin (answer gin_trgm_ops)',
+]
+
+SQLITE_INDEX = [
+  "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+  "question, answer, content='questions', content_rowid='id', tokenize='trigram')",
+  "CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN "
+  "INSERT INTO questions_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer); END",
+  "CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN "
+  "INSERT INTO questions_fts(questions_fts, rowid, question, answer) "
+  "VALUES ('delete', old.id, old.question, old.answer); END",
+  "CREATE TRIGGER IF NOT EXISTS questions_fts_update AFTER UPDATE ON questions BEGIN "
+  "INSERT INTO questions_fts(questions_fts, rowid, question, answer) "
+  "VALUES ('delete', old.id, old.question, old.answer); "
+  "INSERT INTO questions_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer); END",
+]
+
+
+def create_search_index():
+  '''
+  Returns whether search runs on an index now.
+  '''
+  dialect = db.engine.dialect.name
+  try:
+    if dialect == 'postgresql':
+      # CONCURRENTLY cannot run inside a transaction
+      with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        for statement in POSTGRES_INDEX:
+          connection.execute(text(statement))
+      return True
+    if dialect == 'sqlite' and not has_fts():
+      # rows loaded before the triggers existed are indexed by the rebuild
+      for statement in SQLITE_INDEX + ["INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')"]:
+        db.session.execute(statement)
+      db.session.commit()
+      invalidate('search_fts')
+    return has_fts()
+  except DBAPIError as error:
+    db.session.rollback()
+    current_app.logger.warning('search index not created, search scans the table: %s', error.orig)
+    return False
+
+
+def has_fts():
+  return cached('search_fts', lambda: db.engine.dialect.name == 'sqlite' and db.session.execute(
+    "SELECT count(*) FROM sqlite_master WHERE name = 'questions_fts'").scalar() > 0)
+
+
+def like_pattern(term):
+  return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search_questions(term, page=1, per_page=10):
+  '''
+  Returns (total matches, questions of the page).
+  '''
+  # the trigram index needs three characters to match on
+  if has_fts() and len(term) >= 3:
+    return search_fts(term, page, per_page)
+
+  pattern = like_pattern(term)
+  in_question = Question.question.ilike(pattern, escape='\\')
+  query = Question.query.filter(db.or_(in_question, Question.answer.ilike(pattern, escape='\\')))
+  total = query.order_by(None).count()
+
+  order = [db.case((in_question, 0), else_=1)]
+  if db.engine.dialect.name == 'postgresql':
+    order.append(db.func.similarity(Question.question, term).desc())
+  order.append(Question.id)
+  questions = query.order_by(*order).offset((page - 1) * per_page).limit(per_page).all()
+  return total, questions
+
+
+def search_fts(term, page, per_page):
+  match = {'term': '"' + term.replace('"', '""') + '"'}
+  total = db.session.execute(
+    'SELECT count(*) FROM questions_fts WHERE questions_fts MATCH :term', match).scalar()
+  # bm25 is lower for better matches, text counts ten times the answer
+  ids = [row[0] for row in db.session.execute(
+    'SELECT rowid FROM questions_fts WHERE questions_fts MATCH :term '
+    'ORDER BY bm25(questions_fts, 10.0, 1.0), rowid LIMIT :limit OFFSET :offset',
+    dict(match, limit=per_page, offset=(page - 1) * per_page))]
+  questions = {question.id: question for question in Question.query.filter(Question.id.in_(ids))} if ids else {}
+  return total, [questions[id] for id in ids if id in questions]
@@ -5,6 +5,7 @@ from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
 from models import setup_db, Question, Category
+from quiz import QuizIndex, QuizSession
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -34,6 +35,163 @@ class TriviaTestCase(unittest.TestCase):
     Write at least one test for each test for successful operation and for expected errors.
     """
 
+    def test_get_categories(self):
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(len(data['categories']))
+
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+
+    def test_get_paginated_questions(self):
+        res = self.client().get('/questions?page=1')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(data['total_questions'])
+        self.assertTrue(len(data['categories']))
+        self.assertLessEqual(len(data['questions']), 10)
+
+    def test_get_questions_after_cursor(self):
+        first = json.loads(self.client().get('/questions').data)
+        after = first['questions'][-1]['id']
+        res = self.client().get('/questions?after={}'.format(after))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(all(question['id'] > after for question in data['questions']))
+        self.assertEqual(data['total_questions'], first['total_questions'])
+
+    def test_play_quiz_skips_previous_questions(self):
+        previous = []
+        while True:
+            res = self.client().post('/quizzes', json={
+                'previous_questions': previous,
+                'quiz_category': {'type': 'Science', 'id': 1}
+            })
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            if data['question'] is None:
+                break
+            self.assertNotIn(data['question']['id'], previous)
+            self.assertEqual(str(data['question']['category']), '1')
+            previous.append(data['question']['id'])
+
+        self.assertTrue(len(previous))
+
+    def test_quiz_draws_repeat_with_seed(self):
+        def play():
+            client = create_app({'QUIZ_SEED': 42}).test_client()
+            res = client.post('/quizzes', json={'previous_questions': [], 'quiz_category': {'id': 0}})
+            return json.loads(res.data)['question']['id']
+
+        self.assertEqual(play(), play())
+
+    def test_quiz_session_never_repeats_a_question(self):
+        client = self.client()
+        res = client.post('/quizzes/sessions', json={'quiz_category': {'id': 1}})
+        token = json.loads(res.data)['quiz_session']
+
+        seen = []
+        while True:
+            res = client.post('/quizzes', json={'quiz_session': token})
+            question = json.loads(res.data)['question']
+            if question is None:
+                break
+            self.assertEqual(question['category'], 1)
+            seen.append(question['id'])
+
+        self.assertTrue(seen)
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_400_quiz_with_malformed_previous_questions(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [{'id': 1}],
+            'quiz_category': {'id': 0}
+        })
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_404_unknown_quiz_session(self):
+        res = self.client().post('/quizzes', json={'quiz_session': 'unknown'})
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_search_questions(self):
+        res = self.client().post('/questions/search', json={'searchTerm': 'TITLE'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['total_questions'])
+        for question in data['questions']:
+            self.assertIn('title', (question['question'] + question['answer']).lower())
+
+    def test_400_search_without_term(self):
+        res = self.client().post('/questions/search', json={})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_404_requesting_beyond_valid_page(self):
+        res = self.client().get('/questions?page=1000')
+
+        self.assertEqual(res.status_code, 404)
+
+
+class QuizIndexTestCase(unittest.TestCase):
+    """The quiz index on an integer category column, as in trivia.psql"""
+
+    def setUp(self):
+        self.index = QuizIndex([(id, id % 3 + 1) for id in range(1, 31)])
+
+    def test_draws_from_an_integer_category(self):
+        previous = []
+        while True:
+            id = self.index.draw('1', previous)
+            if id is None:
+                break
+            self.assertEqual(id % 3 + 1, 1)
+            self.assertNotIn(id, previous)
+            previous.append(id)
+
+        self.assertEqual(len(previous), 10)
+
+    def test_draws_from_all_categories(self):
+        self.assertIsNotNone(self.index.draw(None, list(range(1, 30))))
+        self.assertIsNone(self.index.draw(None, list(range(1, 31))))
+
+    def test_session_walks_a_category_once(self):
+        session = QuizSession('1')
+        seen = []
+        while True:
+            id = session.draw(self.index)
+            if id is None:
+                break
+            session = QuizSession.loads(session.dumps())
+            seen.append(id)
+
+        self.assertEqual(sorted(seen), list(range(3, 31, 3)))
+
+    def test_session_skips_used_questions_after_reindex(self):
+        session = QuizSession('1')
+        seen = [session.draw(self.index) for _ in range(4)]
+        index = QuizIndex([(id, id % 3 + 1) for id in range(1, 61)])
+        while True:
+            id = session.draw(index)
+            if id is None:
+                break
+            seen.append(id)
+
+        self.assertEqual(sorted(seen), list(range(3, 61, 3)))
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+'''
+Benchmarks for the coffee shop backend.
+
+    python bench.py drinks
+    python bench.py auth
+
+The drinks benchmark runs against BENCH_DATABASE_URL, an in-memory SQLite
+database by default. The auth benchmark signs its own tokens with a fresh RSA
+key and serves the matching key set from a temporary file.
+'''
+import base64
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from flask import Flask
+
+from src.database.models import db, Drink
+
+BENCH_DATABASE_URL = os.environ.get('BENCH_DATABASE_URL', 'sqlite://')
+
+COLORS = ['#d2b48c', '#6f4e37', '#ffffff', '#c0c0c0', '#3b2f2f', '#f5deb3']
+INGREDIENTS = ['espresso', 'milk', 'foam', 'water', 'chocolate', 'cream']
+
+
+def report(name, seconds, operations):
+    print('{:<40} {:>10.1f} ms {:>10.2f} us/op'.format(name, seconds * 1000, seconds * 1e6 / operations))
+
+
+def measure(name, fn, operations):
+    # the collector would otherwise scan 50k drinks mid loop; timeit turns it off too
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        fn()
+        report(name, time.perf_counter() - start, operations)
+    finally:
+        gc.enable()
+
+
+def recipe(rng):
+    return json.dumps([
+        {'color': rng.choice(COLORS), 'name': rng.choice(INGREDIENTS), 'parts': rng.randint(1, 4)}
+        for _ in range(rng.randint(1, 4))
+    ])
+
+
+def parsed_twice(drink):
+    # short() as it was: one parse for a debug print, one for the result
+    json.loads(drink.recipe)
+    short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(drink.recipe)]
+    return {'id': drink.id, 'title': drink.title, 'recipe': short_recipe}
+
+
+def bench_drinks(count=50000):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = BENCH_DATABASE_URL
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    rng = random.Random(0)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Drink.__table__.insert(), [
+            {'title': 'drink {}'.format(i), 'recipe': recipe(rng)} for i in range(count)
+        ])
+        db.session.commit()
+
+        drinks = Drink.query.all()
+        measure('list {}k drinks: short, parsed twice'.format(count // 1000),
+            lambda: [parsed_twice(drink) for drink in drinks], count)
+        measure('list {}k drinks: short, first use'.format(count // 1000),
+            lambda: [drink.short() for drink in drinks], count)
+        measure('list {}k drinks: short, cached'.format(count // 1000),
+            lambda: [drink.short() for drink in drinks], count)
+        measure('list {}k drinks: long, cached'.format(count // 1000),
+            lambda: [drink.long() for drink in drinks], count)
+        measure('write {}k recipes: precompute'.format(count // 1000),
+            lambda: [setattr(drink, 'recipe', drink.recipe) for drink in drinks], count)
+
+
+def b64_int(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def bench_auth(requests=2000, clients=20):
+    from Crypto.PublicKey import RSA
+    from jose import jwt
+    from src.auth import auth
+    from fsnd_common.token_cache import TokenCache
+
+    key = RSA.generate(2048)
+    jwks_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump({'keys': [{'kid': 'bench', 'kty': 'RSA', 'use': 'sig', 'n': b64_int(key.n), 'e': b64_int(key.e)}]}, jwks_file)
+    jwks_file.close()
+    auth.jwks.reset('file://' + jwks_file.name)
+
+    now = int(time.time())
+    tokens = [jwt.encode({
+        'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+        'aud': auth.API_AUDIENCE,
+        'sub': 'client {}'.format(i),
+        'iat': now,
+        'exp': now + 3600,
+        'permissions': ['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks'],
+    }, key.export_key().decode(), algorithm='RS256', headers={'kid': 'bench'}) for i in range(clients)]
+
+    app = Flask(__name__)
+    view = auth.requires_auth('get:drinks-detail')(lambda payload: payload)
+    contexts = [app.test_request_context(headers={'Authorization': 'Bearer ' + token}) for token in tokens]
+
+    def serve():
+        for i in range(requests):
+            with contexts[i % clients]:
+                view()
+
+    try:
+        # every client replays its token, as the frontend does
+        auth.verified_tokens = TokenCache(max_entries=0)
+        measure('auth x{}, {} clients: verify each'.format(requests, clients), serve, requests)
+        auth.verified_tokens = TokenCache()
+        measure('auth x{}, {} clients: token cache'.format(requests, clients), serve, requests)
+        print('token cache {}'.format(auth.verified_tokens.stats()))
+    finally:
+        os.unlink(jwks_file.name)
+
+
+BENCHMARKS = {
+    'auth': bench_auth,
+    'drinks': bench_drinks,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
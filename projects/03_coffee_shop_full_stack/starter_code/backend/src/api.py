@@ -3,12 +3,15 @@ from flask import Flask, request, jsonify, abort
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
+from fsnd_common import instrumentation
+from fsnd_common.conditional import versions
 
 from .database.models import db_drop_and_create_all, setup_db, Drink
 from .auth.auth import AuthError, requires_auth
 
 app = Flask(__name__)
 setup_db(app)
+instrumentation.init_app(app)
 CORS(app)
 
 '''
@@ -20,13 +23,19 @@ CORS(app)
 
 ## ROUTES
 '''
-@TODO implement endpoint
-    GET /drinks
-        it should be a public endpoint
-        it should contain only the drink.short() data representation
-    returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
-        or appropriate status code indicating reason for failure
+GET /drinks
+    public endpoint, the drink.short() data representation of every drink
+    returns status code 200 and json {"success": True, "drinks": drinks}
+    conditional on the drinks version: If-None-Match gets a 304 without
+    touching the database
 '''
+@app.route('/drinks')
+@versions.conditional('drinks')
+def get_drinks():
+    return jsonify({
+        'success': True,
+        'drinks': [drink.short() for drink in Drink.query.order_by(Drink.id).all()]
+    })
 
 
 '''
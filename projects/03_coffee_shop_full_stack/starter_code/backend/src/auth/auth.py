@@ -1,14 +1,20 @@
-import json
+import os
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+from fsnd_common.jwks import JWKSCache
+from fsnd_common.token_cache import TokenCache, permission_set
 
 
 AUTH0_DOMAIN = 'udacity-fsnd.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'dev'
 
+# JWKS_URL points the verifier at a local file or a stand-in server in tests.
+# The first verification starts the background refresh, importing fetches nothing
+jwks = JWKSCache(os.environ.get('JWKS_URL', 'https://{}/.well-known/jwks.json'.format(AUTH0_DOMAIN)), background=True)
+verified_tokens = TokenCache()
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -23,64 +29,166 @@ class AuthError(Exception):
 ## Auth Header
 
 '''
-@TODO implement get_token_auth_header() method
-    it should attempt to get the header from the request
-        it should raise an AuthError if no header is present
-    it should attempt to split bearer and the token
-        it should raise an AuthError if the header is malformed
-    return the token part of the header
+get_token_auth_header()
+    the token part of the Authorization header
+    raises an AuthError if the header is missing or not a bearer token
 '''
 def get_token_auth_header():
-   raise Exception('Not Implemented')
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
 
 '''
-@TODO implement check_permissions(permission, payload) method
+check_permissions(permission, payload)
     @INPUTS
         permission: string permission (i.e. 'post:drink')
         payload: decoded jwt payload
 
-    it should raise an AuthError if permissions are not included in the payload
-        !!NOTE check your RBAC settings in Auth0
-    it should raise an AuthError if the requested permission string is not in the payload permissions array
-    return true otherwise
+    raises an AuthError if the payload has no permissions claim or the
+    permission is not in it, returns true otherwise. Cached payloads carry
+    their permissions as a frozenset, so this is a set lookup.
 '''
 def check_permissions(permission, payload):
-    raise Exception('Not Implemented')
+    if 'permissions' not in payload:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Permissions not included in JWT.'
+        }, 400)
+
+    if permission and permission not in permission_set(payload):
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+    return True
 
 '''
-@TODO implement verify_decode_jwt(token) method
+verify_decode_jwt(token)
     @INPUTS
         token: a json web token (string)
 
-    it should be an Auth0 token with key id (kid)
-    it should verify the token using Auth0 /.well-known/jwks.json
-    it should decode the payload from the token
-    it should validate the claims
-    return the decoded payload
-
-    !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
+    verifies the Auth0 token against the key named by its kid, taken from
+    the JWKS cache (see fsnd_common.jwks) rather than fetched per request
+    validates the claims and returns the decoded payload
 '''
 def verify_decode_jwt(token):
-    raise Exception('Not Implemented')
+    return decode_jwt(token, jwks.get_key(unverified_kid(token)))
+
+'''
+verify_decode_jwt_async(token)
+    verify_decode_jwt() for async views, the event loop is only left when
+    the JWKS cache has to fetch keys
+'''
+async def verify_decode_jwt_async(token):
+    return decode_jwt(token, await jwks.get_key_async(unverified_kid(token)))
+
+def unverified_kid(token):
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
+    if 'kid' not in unverified_header:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
+    return unverified_header['kid']
+
+def decode_jwt(token, rsa_key):
+    if not rsa_key:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to find the appropriate key.'
+        }, 400)
+
+    try:
+        return jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer='https://' + AUTH0_DOMAIN + '/'
+        )
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience and issuer.'
+        }, 401)
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
 
 '''
-@TODO implement @requires_auth(permission) decorator method
+@requires_auth(permission)
     @INPUTS
         permission: string permission (i.e. 'post:drink')
 
-    it should use the get_token_auth_header method to get the token
-    it should use the verify_decode_jwt method to decode the jwt
-    it should use the check_permissions method validate claims and check the requested permission
-    return the decorator which passes the decoded payload to the decorated method
+    checks the bearer token of the request and the requested permission,
+    then passes the decoded payload to the decorated method. Tokens that
+    verified before are served from verified_tokens without another
+    signature check (see fsnd_common.token_cache).
 '''
 def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
+            payload = verified_tokens.verify(token, verify_decode_jwt)
             check_permissions(permission, payload)
             return f(payload, *args, **kwargs)
 
         return wrapper
-    return requires_auth_decorator
\ No newline at end of file
+    return requires_auth_decorator
+
+'''
+@requires_auth_async(permission)
+    requires_auth() for async views (Flask 2 with the async extra), the
+    decorated coroutine receives the decoded payload
+'''
+def requires_auth_async(permission=''):
+    def requires_auth_decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            token = get_token_auth_header()
+            payload = verified_tokens.get(token)
+            if payload is None:
+                payload = verified_tokens.put(token, await verify_decode_jwt_async(token))
+            check_permissions(permission, payload)
+            return await f(payload, *args, **kwargs)
+
+        return wrapper
+    return requires_auth_decorator
@@ -1,8 +1,13 @@
 import os
-from sqlalchemy import Column, String, Integer
+from contextlib import contextmanager
+from itertools import islice
+from sqlalchemy import Column, String, Integer, event, text
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_common.engine import configure_engine
+from fsnd_common.conditional import versions
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
@@ -12,10 +17,12 @@ db = SQLAlchemy()
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    pool and connection settings come from engine.configure_engine()
 '''
 def setup_db(app):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    configure_engine(app)
     db.app = app
     db.init_app(app)
 
@@ -29,6 +36,68 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+unit_of_work(commit_every=None)
+    batches the write helpers called in the block: insert(), update() and
+    delete() no longer commit one by one, the block commits once at the end,
+    or every commit_every writes, and rolls back if it raises. The drinks
+    version is bumped once, when it ends. A unit_of_work inside another
+    joins it.
+    EXAMPLE
+        with unit_of_work():
+            for drink in drinks:
+                drink.delete()
+'''
+class UnitOfWork(object):
+    def __init__(self, commit_every=None):
+        self.commit_every = commit_every
+        self.writes = 0
+        self.resources = set()
+
+@contextmanager
+def unit_of_work(commit_every=None):
+    work = db.session.info.get('unit_of_work')
+    if work is not None:
+        yield work
+        return
+
+    work = db.session.info['unit_of_work'] = UnitOfWork(commit_every)
+    try:
+        yield work
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    finally:
+        del db.session.info['unit_of_work']
+        # batches committed before a failure are in the database too
+        versions.bump(*work.resources)
+
+'''
+commit(resources)
+    ends a write helper: commits and bumps the versions it changed, or
+    leaves both to the enclosing unit_of_work
+'''
+def commit(resources):
+    work = db.session.info.get('unit_of_work')
+    if work is None:
+        db.session.commit()
+        versions.bump(*resources)
+        return
+
+    work.resources.update(resources)
+    work.writes += 1
+    if work.commit_every and work.writes % work.commit_every == 0:
+        db.session.commit()
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -42,17 +111,28 @@ class Drink(db.Model):
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
     recipe =  Column(String(180), nullable=False)
 
+    '''
+    recipe_forms()
+        the recipe as (json, long form, short form). It is parsed once per
+        recipe value and kept on the instance: assigning recipe parses it right
+        away (see set_recipe below), a row loaded from the database parses it
+        on first use. The forms are shared, treat them as read only.
+    '''
+    def recipe_forms(self):
+        forms = self.__dict__.get('_recipe_forms')
+        if forms is None or forms[0] != self.recipe:
+            forms = self._recipe_forms = parse_recipe(self.recipe)
+        return forms
+
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': short_recipe
+            'recipe': self.recipe_forms()[2]
         }
 
     '''
@@ -63,7 +143,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.recipe_forms()[1]
         }
 
     '''
@@ -77,7 +157,7 @@ class Drink(db.Model):
     '''
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit(('drinks',))
 
     '''
     delete()
@@ -89,7 +169,7 @@ class Drink(db.Model):
     '''
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        commit(('drinks',))
 
     '''
     update()
@@ -101,7 +181,56 @@ class Drink(db.Model):
             drink.update()
     '''
     def update(self):
-        db.session.commit()
+        commit(('drinks',))
+
+    '''
+    bulk_upsert(drinks, batch_size=500)
+        inserts drinks, dicts with a title and a recipe (json or a list),
+        replacing the recipe of drinks whose title already exists. Every
+        batch_size drinks go in one executemany of INSERT ... ON CONFLICT,
+        which SQLite and Postgres both run, committed once at the end or
+        with the enclosing unit_of_work. Recipes are parsed before their
+        batch is written. Returns the number of drinks written.
+        EXAMPLE
+            Drink.bulk_upsert([{'title': 'Water', 'recipe': [{'name': 'water', 'color': 'blue', 'parts': 1}]}])
+    '''
+    @classmethod
+    def bulk_upsert(cls, drinks, batch_size=500):
+        statement = text(
+            'INSERT INTO {0} (title, recipe) VALUES (:title, :recipe) '
+            'ON CONFLICT (title) DO UPDATE SET recipe = excluded.recipe'.format(cls.__table__.name))
+        count = 0
+        with unit_of_work():
+            for batch in batches(drinks, batch_size):
+                rows = []
+                for drink in batch:
+                    recipe = drink['recipe'] if isinstance(drink['recipe'], str) else json.dumps(drink['recipe'])
+                    parse_recipe(recipe)
+                    rows.append({'title': drink['title'], 'recipe': recipe})
+                db.session.execute(statement, rows)
+                count += len(rows)
+                commit(('drinks',))
+        return count
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+'''
+parse_recipe(recipe)
+    the (json, long form, short form) of a recipe json blob
+'''
+def parse_recipe(recipe):
+    long_recipe = json.loads(recipe)
+    short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in long_recipe]
+    return recipe, long_recipe, short_recipe
+
+
+'''
+set_recipe()
+    precomputes the recipe forms when a drink is written, so the request
+    that created or changed it does not parse the recipe again to answer
+'''
+@event.listens_for(Drink.recipe, 'set')
+def set_recipe(drink, recipe, oldvalue, initiator):
+    if isinstance(recipe, str):
+        drink._recipe_forms = parse_recipe(recipe)
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fsnd_common.jwks import HTTPClient, JWKSCache
+
+JWKS = {'keys': [{'kid': 'test', 'kty': 'RSA', 'use': 'sig', 'n': 'n', 'e': 'AQAB'}]}
+
+
+class MockJWKSServer(ThreadingHTTPServer):
+    '''
+    Serves JWKS after sleeping `latency` seconds, counting the requests and
+    the connections they came over.
+    '''
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super(MockJWKSServer, self).__init__(('127.0.0.1', 0), MockJWKSHandler)
+        self.latency = latency
+        self.requests = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/.well-known/jwks.json'.format(self.server_port)
+
+
+class MockJWKSHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.connections.add(self.client_address)
+        time.sleep(self.server.latency)
+        body = json.dumps(JWKS).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'public, max-age=600')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class JWKSFetchTestCase(unittest.TestCase):
+    """This class represents the JWKS fetching test case"""
+
+    def setUp(self):
+        self.server = MockJWKSServer(latency=0.2)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_cold_cache_fetches_once_for_concurrent_requests(self):
+        jwks = JWKSCache(self.server.url, client=HTTPClient())
+        keys = []
+        threads = [threading.Thread(target=lambda: keys.append(jwks.get_key('test'))) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(len(keys), 20)
+        self.assertTrue(all(key['kid'] == 'test' for key in keys))
+
+    def test_slow_provider_times_out(self):
+        self.server.latency = 2
+        jwks = JWKSCache(self.server.url, client=HTTPClient(timeout=0.3))
+        start = time.monotonic()
+
+        self.assertIsNone(jwks.get_key('test'))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_client_reuses_connections(self):
+        self.server.latency = 0
+        client = HTTPClient()
+        for _ in range(5):
+            body, headers = client.get(self.server.url)
+
+        self.assertEqual(json.loads(body), JWKS)
+        self.assertEqual(self.server.requests, 5)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_async_verifiers_share_one_fetch(self):
+        jwks = JWKSCache(self.server.url, client=HTTPClient())
+
+        async def verify_many():
+            return await asyncio.gather(*[jwks.get_key_async('test') for _ in range(20)])
+
+        keys = asyncio.new_event_loop().run_until_complete(verify_many())
+
+        self.assertEqual(self.server.requests, 1)
+        self.assertTrue(all(key['kid'] == 'test' for key in keys))
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        jwks = JWKSCache(self.server.url, client=HTTPClient(), refetch_interval=30)
+        jwks.get_key('test')
+        for _ in range(10):
+            self.assertIsNone(jwks.get_key('rotated'))
+
+        self.assertEqual(self.server.requests, 1)
+
+    def test_background_refresh_starts_on_first_key(self):
+        jwks = JWKSCache('http://127.0.0.1:1/unreachable.json', client=HTTPClient(timeout=0.3), background=True)
+        self.assertIsNone(jwks.thread)
+
+        jwks.reset(self.server.url)
+        self.assertEqual(jwks.get_key('test')['kid'], 'test')
+        self.assertTrue(jwks.thread.is_alive())
+        self.assertEqual(self.server.requests, 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
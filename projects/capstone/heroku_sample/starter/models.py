@@ -2,6 +2,8 @@ from sqlalchemy import Column, String, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from fsnd_common.engine import configure_engine
+
 database_path = os.environ['DATABASE_URL']
 
 db = SQLAlchemy()
@@ -9,10 +11,12 @@ db = SQLAlchemy()
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    pool and connection settings come from engine.configure_engine()
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    configure_engine(app)
     db.app = app
     db.init_app(app)
     db.create_all()
@@ -0,0 +1,11 @@
+'''
+Helpers shared by the Full-Stack Nanodegree apps. Each app installs this
+directory from its requirements.txt (-e <path to shared>), so there is one
+copy of each module for all of them:
+
+    conditional      ETag / 304 Not Modified for rarely changing views
+    engine           connection pool profiles, SQLite pragmas and pool status
+    instrumentation  per-request SQL counts, timing and N+1 detection
+    jwks             Auth0 signing keys, fetched once and refreshed
+    token_cache      verified access tokens of the Auth0 verifiers
+'''
@@ -0,0 +1,78 @@
+'''
+Conditional GET for JSON lists that rarely change.
+
+Every resource has a version counter, bumped by the model write helpers
+(the trivia Question.insert() calls versions.bump('questions')). A view
+decorated with versions.conditional('questions') answers If-None-Match with
+304 Not Modified from the counters alone, before it runs any query, and tags
+full responses with a strong ETag built from the same counters. Views that
+keep their own tag, like the FlaskRecap greetings, use conditional(etag)
+directly.
+
+The counters live in the process, under a random epoch so a restart never
+hands out an ETag it used before. With several worker processes, set
+versions.backend to a shared redis-py compatible client (get and incr), so
+a write through one worker changes the ETag all of them send.
+'''
+import os
+import threading
+from functools import wraps
+from flask import request, make_response
+
+
+class LocalCounters(object):
+    def __init__(self):
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.counters.get(key, 0)
+
+    def incr(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+
+class Versions(object):
+    def __init__(self, backend=None, prefix='version:'):
+        self.backend = backend or LocalCounters()
+        self.prefix = prefix
+        self.epoch = os.urandom(4).hex()
+
+    def bump(self, *resources):
+        for resource in resources:
+            self.backend.incr(self.prefix + resource)
+
+    def etag(self, *resources):
+        epoch = self.epoch if isinstance(self.backend, LocalCounters) else 'shared'
+        return '-'.join([epoch] + [str(int(self.backend.get(self.prefix + resource) or 0)) for resource in resources])
+
+    def conditional(self, *resources):
+        return conditional(lambda: self.etag(*resources))
+
+
+versions = Versions()
+
+
+def conditional(etag):
+    '''
+    Serves a view conditionally on etag(), a function returning the current
+    tag of what the view renders.
+    '''
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            tag = etag()
+            if request.if_none_match.contains(tag):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            # stored, but checked with us before every reuse
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
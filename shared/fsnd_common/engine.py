@@ -0,0 +1,178 @@
+'''
+Engine configuration for Flask-SQLAlchemy.
+
+configure_engine(app) fills SQLALCHEMY_ENGINE_OPTIONS for the database URI
+set at that point, so call it after the URI and before the first query.
+Settings come from a pool profile, then app config, then the environment:
+
+        DATABASE_POOL_PROFILE       web, worker or test; by default worker under the flask
+                                    command (migrations, imports and other CLI commands)
+                                    except flask run, web otherwise
+        DATABASE_POOL_SIZE          connections kept open
+        DATABASE_MAX_OVERFLOW       extra connections opened under load
+        DATABASE_POOL_TIMEOUT       seconds to wait for a free connection
+        DATABASE_POOL_RECYCLE       seconds before a connection is replaced
+        DATABASE_POOL_PRE_PING      test connections before handing them out
+        DATABASE_STATEMENT_TIMEOUT  milliseconds before Postgres cancels a statement
+
+SQLite files get a pool too, with WAL journaling and the SQLITE_PRAGMAS
+below on every new connection, so readers no longer wait on a writer.
+
+pool_status(engine) reports the pool as it is now: connections checked out
+and in, overflow in use, and how long callers waited to get one.
+'''
+import os
+import sqlite3
+import sys
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+PROFILES = {
+    # request handlers: a few connections, fail fast when the database is slow
+    'web': {
+        'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 10, 'pool_recycle': 1800,
+        'pool_pre_ping': True, 'statement_timeout': 5000,
+    },
+    # CLI commands and batch jobs: long statements, little concurrency
+    'worker': {
+        'pool_size': 2, 'max_overflow': 2, 'pool_timeout': 60, 'pool_recycle': 1800,
+        'pool_pre_ping': True, 'statement_timeout': 600000,
+    },
+    'test': {
+        'pool_size': 1, 'max_overflow': 4, 'pool_timeout': 5, 'pool_recycle': -1,
+        'pool_pre_ping': False, 'statement_timeout': None,
+    },
+}
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'busy_timeout': 30000,
+}
+
+
+class TimedQueuePool(QueuePool):
+    '''
+    QueuePool that keeps how long callers waited for a connection, opening a
+    new one included.
+    '''
+    def __init__(self, *args, **kwargs):
+        super(TimedQueuePool, self).__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self.stats_lock:
+                self.waits += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+                self.timeouts += timed_out
+
+
+@event.listens_for(TimedQueuePool, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+        cursor.close()
+
+
+def setting(config, profile, name):
+    key = 'DATABASE_' + name.upper()
+    value = os.environ.get(key, config.get(key, profile[name]))
+    if not isinstance(value, str):
+        return value
+    if value.lower() in ('none', ''):
+        return None
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    return int(value)
+
+
+def default_profile(argv=None):
+    '''
+    worker when the process is the flask command running anything but
+    `flask run`, web otherwise.
+    '''
+    argv = sys.argv if argv is None else argv
+    if not argv:
+        return 'web'
+    script = os.path.abspath(argv[0])
+    # `flask ...` or `python -m flask ...`
+    if os.path.basename(script) not in ('flask', 'flask.exe') and os.path.basename(os.path.dirname(script)) != 'flask':
+        return 'web'
+    command = next((arg for arg in argv[1:] if not arg.startswith('-')), 'run')
+    return 'web' if command == 'run' else 'worker'
+
+
+def engine_options(uri, config):
+    name = os.environ.get('DATABASE_POOL_PROFILE') or config.get('DATABASE_POOL_PROFILE') or default_profile()
+    profile = PROFILES[name]
+    url = make_url(uri)
+    if url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:'):
+        # one connection holds the whole database, leave its pool alone
+        return {}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': setting(config, profile, 'pool_size'),
+        'max_overflow': setting(config, profile, 'max_overflow'),
+        'pool_timeout': setting(config, profile, 'pool_timeout'),
+        'pool_recycle': setting(config, profile, 'pool_recycle'),
+        'pool_pre_ping': setting(config, profile, 'pool_pre_ping'),
+    }
+    statement_timeout = setting(config, profile, 'statement_timeout')
+    if url.drivername.startswith('sqlite'):
+        # pooled connections move between threads
+        options['connect_args'] = {'check_same_thread': False}
+    elif url.drivername.startswith('postgres') and statement_timeout:
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(statement_timeout)}
+    return options
+
+
+def configure_engine(app):
+    '''
+    Sets SQLALCHEMY_ENGINE_OPTIONS for app's SQLALCHEMY_DATABASE_URI, with
+    any create_engine arguments in DATABASE_ENGINE_OPTIONS on top.
+    '''
+    options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    options.update(app.config.get('DATABASE_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def pool_status(engine):
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        })
+    if isinstance(pool, TimedQueuePool):
+        with pool.stats_lock:
+            status.update({
+                'waits': pool.waits,
+                'wait_ms_total': round(pool.wait_time * 1000, 1),
+                'wait_ms_max': round(pool.max_wait * 1000, 1),
+                'timeouts': pool.timeouts,
+            })
+    return status
@@ -0,0 +1,133 @@
+'''
+Per-request SQL instrumentation.
+
+init_app(app) records every statement a request sends through SQLAlchemy:
+how many, the total database time, and how often each statement shape
+(fingerprint) repeats, which is how an N+1 loop shows up. The numbers go out
+as a Server-Timing header and one structured log line per request.
+
+With SQL_QUERY_BUDGET set, a request issuing more statements than the budget
+raises QueryBudgetExceeded, so a test client request fails loudly. Tests can
+also wrap calls in query_budget(n).
+'''
+import json
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(Exception):
+    def __init__(self, stats, budget):
+        super(QueryBudgetExceeded, self).__init__(
+            '{} statements issued, budget is {}'.format(stats.count, budget))
+        self.stats = stats
+        self.budget = budget
+
+
+class QueryStats(object):
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold=2):
+        return [(statement, count) for statement, count in self.fingerprints.most_common() if count >= threshold]
+
+
+def fingerprint(statement):
+    # statements arrive with bound parameters, fold what is left: literals,
+    # IN lists of any length and whitespace
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+\b', '?', statement)
+    statement = re.sub(r'\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))*\s*\)', '(?)', statement)
+    return ' '.join(statement.split())
+
+
+# QueryStats of the open query_budget blocks, they see every request
+budgets = []
+
+
+def current_stats():
+    stats = list(budgets)
+    if has_app_context() and g.get('sql_stats') is not None:
+        stats.append(g.sql_stats)
+    return stats
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    for stats in current_stats():
+        stats.record(statement, duration)
+
+
+def handle_error(context):
+    # the statement failed, after_cursor_execute will not pop its start
+    starts = context.connection.info.get('query_start') if context.connection is not None else None
+    if starts and context.execution_context is not None:
+        starts.pop()
+
+
+@contextmanager
+def query_budget(budget):
+    '''
+    Raises QueryBudgetExceeded when the block issues more than budget
+    statements, e.g. around a test client call.
+    '''
+    stats = QueryStats()
+    budgets.append(stats)
+    try:
+        yield stats
+    finally:
+        budgets.remove(stats)
+    if stats.count > budget:
+        raise QueryBudgetExceeded(stats, budget)
+
+
+def init_app(app):
+    app.config.setdefault('SQL_QUERY_BUDGET', None)
+    app.config.setdefault('SQL_REPEAT_THRESHOLD', 5)
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
+
+    @app.before_request
+    def start_query_stats():
+        g.sql_stats = QueryStats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        response.headers.add('Server-Timing', 'db;dur={:.1f};desc="{} queries"'.format(
+            stats.duration * 1000, stats.count))
+
+        repeated = stats.repeated(app.config['SQL_REPEAT_THRESHOLD'])
+        log = app.logger.warning if repeated else app.logger.info
+        log(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': stats.count,
+            'db_ms': round(stats.duration * 1000, 1),
+            'repeated': [{'statement': statement, 'count': count} for statement, count in repeated],
+        }))
+
+        budget = app.config['SQL_QUERY_BUDGET']
+        if budget is not None and stats.count > budget:
+            raise QueryBudgetExceeded(stats, budget)
+        return response
@@ -0,0 +1,275 @@
+'''
+JWKS key cache for the Auth0 verifiers.
+
+Fetching https://{AUTH0_DOMAIN}/.well-known/jwks.json on every request puts a
+network round trip in front of each protected call. JWKSCache fetches the key
+set once and keeps it, indexed by kid, for as long as the response's
+Cache-Control max-age allows:
+
+    jwks = JWKSCache('https://{}/.well-known/jwks.json'.format(AUTH0_DOMAIN), background=True)
+    rsa_key = jwks.get_key(unverified_header['kid'])
+
+With background=True the first get_key() starts a daemon thread that
+refreshes the keys ahead of their expiry, so later requests never wait on a
+fetch. Nothing is fetched before that first call, importing a module that
+builds a cache stays offline; tests and benchmarks can point it elsewhere
+with reset(url) first.
+
+A kid the cache does not know triggers a refetch, since it usually means the
+keys were rotated, but at most once every refetch_interval seconds so tokens
+with made up kids cannot hammer the identity provider. When a refresh fails
+the keys already held are served until one succeeds.
+
+Fetches go through one pooled HTTPClient shared by every cache: kept-alive
+connections and a timeout on each, so a slow identity provider costs a
+bounded wait instead of a blocked worker. Refreshes are single-flight, when
+the cache is cold concurrent requests wait on one fetch instead of each
+sending their own. Async views use get_key_async(), which only leaves the
+event loop when the keys have to be fetched.
+
+Any URL urlopen reads works, so tests can point the cache at a local file
+(file:///path/to/jwks.json) or a stand-in HTTP server.
+'''
+import asyncio
+import http.client
+import json
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+KEY_FIELDS = ('kty', 'kid', 'use', 'n', 'e')
+
+
+def max_age(headers):
+    '''
+    The max-age of a Cache-Control header in seconds, None without one or
+    when the response must not be cached.
+    '''
+    cache_control = (headers or {}).get('Cache-Control') or ''
+    if re.search(r'\b(no-store|no-cache)\b', cache_control):
+        return None
+    match = re.search(r'\bmax-age=(\d+)', cache_control)
+    return int(match.group(1)) if match else None
+
+
+def index_keys(jwks):
+    return {
+        key['kid']: {field: key[field] for field in KEY_FIELDS if field in key}
+        for key in jwks.get('keys', []) if 'kid' in key
+    }
+
+
+class HTTPClient(object):
+    '''
+    GETs over kept-alive connections, at most max_idle of them per host.
+    timeout bounds the connect and every read, in seconds. Other URL schemes
+    (file://) go through urlopen.
+    '''
+    def __init__(self, timeout=5, max_idle=4):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def connect(self, scheme, netloc):
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def get(self, url):
+        '''
+        Returns (body, response headers), raises OSError unless the status
+        is 200.
+        '''
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            with urlopen(url, timeout=self.timeout) as response:
+                return response.read(), response.headers
+
+        host = (parts.scheme, parts.netloc)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        while True:
+            with self.lock:
+                pooled = self.idle.get(host)
+                connection = pooled.pop() if pooled else None
+            reused = connection is not None
+            connection = connection or self.connect(*host)
+            try:
+                connection.request('GET', path, headers={'Accept': 'application/json'})
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                # the server dropped an idle connection, retry on a new one
+                if reused:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            with self.lock:
+                pooled = self.idle.setdefault(host, [])
+                if len(pooled) < self.max_idle:
+                    pooled.append(connection)
+                    connection = None
+            if connection is not None:
+                connection.close()
+        if response.status != 200:
+            raise OSError('GET {} returned {}'.format(url, response.status))
+        return body, response.headers
+
+
+class SingleFlight(object):
+    '''
+    Runs one call per key at a time. Callers arriving while it is in flight
+    wait for it and share its result, or its exception.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = {'done': threading.Event()}
+        if not leader:
+            flight['done'].wait()
+            if 'error' in flight:
+                raise flight['error']
+            return flight['result']
+
+        try:
+            flight['result'] = fn()
+            return flight['result']
+        except BaseException as error:
+            flight['error'] = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight['done'].set()
+
+
+# one pool for every cache of the process
+default_client = HTTPClient()
+
+
+class JWKSCache(object):
+    def __init__(self, url, default_ttl=600, min_ttl=60, max_ttl=86400,
+                 refetch_interval=30, client=None, background=False):
+        self.url = url
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.refetch_interval = refetch_interval
+        self.client = client or default_client
+        self.keys = {}
+        self.fetched_at = None
+        self.expires_at = 0
+        self.flight = SingleFlight()
+        self.background = background
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+    def reset(self, url=None):
+        '''
+        Forgets the keys, and with url fetches from there from now on.
+        '''
+        if url is not None:
+            self.url = url
+        self.keys = {}
+        self.fetched_at = None
+        self.expires_at = 0
+
+    def fetch(self):
+        '''
+        Returns (key set as a dict, response headers).
+        '''
+        body, headers = self.client.get(self.url)
+        return json.loads(body), headers
+
+    def refresh(self, after=None):
+        '''
+        Fetches the key set unless another thread did so since `after`.
+        Returns False when the fetch failed.
+        '''
+        return self.flight.do(self.url, lambda: self.fetch_keys(after))
+
+    def fetch_keys(self, after):
+        if after is not None and self.fetched_at is not None and self.fetched_at > after:
+            return True
+        attempted = time.monotonic()
+        try:
+            jwks, headers = self.fetch()
+        except Exception as error:
+            logger.warning('fetching %s failed: %s', self.url, error)
+            # count failures too, or every request retries a down server
+            self.fetched_at = attempted
+            return False
+
+        ttl = max_age(headers)
+        ttl = self.default_ttl if ttl is None else min(max(ttl, self.min_ttl), self.max_ttl)
+        self.keys = index_keys(jwks)
+        self.expires_at = attempted + ttl
+        self.fetched_at = attempted
+        return True
+
+    def needs_refresh(self, kid, now):
+        if self.fetched_at is None:
+            return True
+        return (now >= self.expires_at or kid not in self.keys) and now - self.fetched_at >= self.refetch_interval
+
+    def get_key(self, kid):
+        '''
+        The key with this kid as the dict jwt.decode expects, None if the
+        identity provider does not publish one.
+        '''
+        now = time.monotonic()
+        if self.needs_refresh(kid, now):
+            self.refresh(after=now)
+        # after the first fetch, which the thread then does not repeat
+        if self.background and self.thread is None:
+            self.start()
+        return self.keys.get(kid)
+
+    async def get_key_async(self, kid):
+        '''
+        get_key() for coroutines: answered on the event loop while the keys
+        are fresh, fetched in the default executor otherwise, still single
+        flight with every other caller.
+        '''
+        if not self.needs_refresh(kid, time.monotonic()):
+            return self.keys.get(kid)
+        return await asyncio.get_event_loop().run_in_executor(None, self.get_key, kid)
+
+    def start(self, ahead=0.8):
+        '''
+        Refreshes the keys in a daemon thread once `ahead` of their ttl has
+        passed, so requests never wait on a fetch.
+        '''
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, args=(ahead,), daemon=True)
+                self.thread.start()
+        return self
+
+    def run(self, ahead):
+        while True:
+            if self.fetched_at is None:
+                self.refresh()
+            ttl = self.expires_at - self.fetched_at
+            delay = ttl * ahead if ttl > 0 else self.refetch_interval
+            time.sleep(max(delay - (time.monotonic() - self.fetched_at), 1))
+            self.refresh(after=time.monotonic())
@@ -0,0 +1,91 @@
+'''
+Cache of verified access tokens.
+
+A client replays the same bearer token on every request until it expires,
+and each replay used to pay a full RS256 signature check. TokenCache keeps
+the payloads of tokens that verified, keyed by the SHA-256 of the token so
+the cache never holds usable credentials, in a bounded LRU:
+
+    verified_tokens = TokenCache()
+    payload = verified_tokens.verify(token, verify_decode_jwt)
+
+An entry is dropped at the token's exp, or max_ttl seconds after it was
+verified if that comes first, which bounds how long a token signed by a key
+the identity provider has since rotated out keeps working. Only successful
+verifications are cached, a bad token is checked again every time.
+
+Payloads come back as Payload dicts carrying their permissions as a
+frozenset, so a permission check is a set lookup. They are shared between
+requests, treat them as read only.
+'''
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class Payload(dict):
+    def __init__(self, payload):
+        super(Payload, self).__init__(payload)
+        self.permissions = frozenset(payload.get('permissions') or ())
+
+
+def permission_set(payload):
+    if isinstance(payload, Payload):
+        return payload.permissions
+    return frozenset(payload.get('permissions') or ())
+
+
+class TokenCache(object):
+    def __init__(self, max_entries=4096, max_ttl=300):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires = entry
+            if expires <= time.time():
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token, payload):
+        payload = Payload(payload)
+        expires = time.time() + self.max_ttl
+        if isinstance(payload.get('exp'), (int, float)):
+            expires = min(expires, payload['exp'])
+        key = self.key(token)
+        with self.lock:
+            self.entries[key] = (payload, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return payload
+
+    def verify(self, token, verify):
+        '''
+        The cached payload of token, or verify(token) cached for next time.
+        '''
+        payload = self.get(token)
+        if payload is None:
+            payload = self.put(token, verify(token))
+        return payload
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
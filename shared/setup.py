@@ -0,0 +1,9 @@
+from setuptools import setup
+
+setup(
+    name='fsnd-common',
+    version='0.1.0',
+    description='Flask and SQLAlchemy helpers shared by the Full-Stack Nanodegree apps',
+    packages=['fsnd_common'],
+    install_requires=['Flask', 'SQLAlchemy'],
+)